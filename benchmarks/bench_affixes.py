@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmarks for `spacy_affixes`.
+
+They run offline against the small Freeling-like rules and dictionary
+bundled in `tests/fixtures/freeling` and a blank spaCy pipeline, so numbers
+can be compared across spaCy and data versions::
+
+    python benchmarks/bench_affixes.py [--docs 2000] [--repeat 3] [--json]
+
+With `--lexicon`, the accents stripping is also checked against
+`unicodedata` on every word of the installed lexicon.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import spacy
+
+from spacy_affixes import AffixesMatcher
+from spacy_affixes import utils
+from spacy_affixes.eagles import eagles2ud
+
+FIXTURES_DIR = (Path(__file__).resolve().parent.parent
+                / "tests" / "fixtures" / "freeling")
+LANG = "es"
+VERSION = "4.1"
+CLITICS = ("lo", "la", "me", "se", "te", "le", "melo", "selo", "telo")
+
+
+def rss_kb():
+    """Current resident set size in KiB (peak if it cannot be read)"""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def best_of(function, repeat, setup=None):
+    """Best wall time in seconds of `repeat` runs of `function`"""
+    times = []
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        function(argument)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def synthetic_texts(lexicon, count, clitics, seed=0):
+    """
+    Build Spanish-like sentences from lexicon words. When `clitics` is
+    true, every sentence has imperative, infinitive and gerund forms with
+    enclitic pronouns attached
+    """
+    rng = random.Random(seed)
+    words = sorted(lexicon)
+    verbs = sorted(word for word in words if any(
+        analysis["eagle"][:3] in ("VMM", "VMN", "VMG")
+        for analysis in lexicon[word]
+    ))
+    texts = []
+    for _ in range(count):
+        tokens = rng.sample(words, 12)
+        if clitics:
+            for position in rng.sample(range(len(tokens)), 4):
+                tokens[position] = rng.choice(verbs) + rng.choice(CLITICS)
+        texts.append(" ".join(tokens) + ".")
+    return texts
+
+
+def lexicon_stems(lexicon):
+    """
+    Every lexicon word and its prefixes, as the stems left by the suffixes
+    rules
+    """
+    return (word[:end] for word in lexicon
+            for end in range(1, len(word) + 1))
+
+
+def strip_accents_mismatches(stems):
+    """Number of stems whose accents are stripped unlike `unicodedata`"""
+    return sum(
+        utils.fold_accents(stem) != utils.unicodedata_strip_accents(stem)
+        for stem in stems)
+
+
+def run_benchmarks(model=None, docs=2000, repeat=3, seed=0):
+    results = {}
+    affixes_raw = (FIXTURES_DIR / "afixos.dat").read_text(encoding="utf-8")
+    lexicon_raw = (FIXTURES_DIR / "dicc.src").read_bytes()
+    results["build_affixes_s"] = best_of(
+        lambda _: utils.build_affixes(affixes_raw), repeat)
+    results["build_lexicon_s"] = best_of(
+        lambda _: utils.build_lexicon(lexicon_raw), repeat)
+    data_dir = utils.DATA_DIR
+    with tempfile.TemporaryDirectory() as temp_dir:
+        utils.DATA_DIR = temp_dir
+        try:
+            utils.write_affixes(LANG, VERSION,
+                                utils.build_affixes(affixes_raw))
+            lexicon = utils.build_lexicon(lexicon_raw)
+            utils.write_lexicon(LANG, VERSION, lexicon)
+            rss = rss_kb()
+            results["load_affixes_s"] = best_of(
+                lambda _: utils.load_affixes(LANG, VERSION), repeat)
+            results["load_lexicon_s"] = best_of(
+                lambda _: dict(utils.load_lexicon(LANG, VERSION)), repeat)
+            results["load_rss_kb"] = rss_kb() - rss
+            nlp = spacy.load(model) if model else spacy.blank(LANG)
+            results["matcher_init_s"] = best_of(
+                lambda _: AffixesMatcher(nlp, split_on="*"), repeat)
+            affixes_matcher = AffixesMatcher(nlp, split_on="*")
+            for name, clitics in (("clitics", True), ("no_clitics", False)):
+                texts = synthetic_texts(lexicon, docs, clitics, seed)
+
+                def make_docs():
+                    affixes_matcher.clear_cache()
+                    return [nlp.make_doc(text) for text in texts]
+
+                tokens = sum(len(doc) for doc in make_docs())
+                call_s = best_of(
+                    lambda docs_: [affixes_matcher(doc) for doc in docs_],
+                    repeat, make_docs)
+                pipe_s = best_of(
+                    lambda docs_: list(affixes_matcher.pipe(docs_)),
+                    repeat, make_docs)
+                results[f"call_{name}_tokens_per_s"] = tokens / call_s
+                results[f"pipe_{name}_tokens_per_s"] = tokens / pipe_s
+        finally:
+            utils.DATA_DIR = data_dir
+    eagles = sorted({analysis["eagle"]
+                     for analyses in lexicon.values()
+                     for analysis in analyses})
+    calls = 100 * len(eagles)
+    for name, function in (("eagles2ud", eagles2ud),
+                           ("eagles2ud_uncached", eagles2ud.__wrapped__)):
+        seconds = best_of(
+            lambda _: [function(eagle) for _ in range(100)
+                       for eagle in eagles], repeat)
+        results[f"{name}_calls_per_s"] = calls / seconds
+    stems = sorted(lexicon_stems(lexicon))
+    results["strip_accents_mismatches"] = strip_accents_mismatches(stems)
+    for name, function in (
+            ("strip_accents", utils.strip_accents),
+            ("strip_accents_uncached", utils.strip_accents.__wrapped__),
+            ("strip_accents_unicodedata", utils.unicodedata_strip_accents)):
+        seconds = best_of(
+            lambda _: [function(stem) for stem in stems], repeat)
+        results[f"{name}_calls_per_s"] = len(stems) / seconds
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--model", default=None,
+                        help="SpaCy model to load (defaults to blank 'es')")
+    parser.add_argument("--docs", type=int, default=2000,
+                        help="Number of synthetic docs per text kind")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per benchmark, the best one is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true",
+                        help="Print the results as JSON")
+    parser.add_argument("--lexicon", action="store_true",
+                        help="Also check the accents stripping of the "
+                             "installed lexicon against `unicodedata`")
+    args = parser.parse_args(argv)
+    results = run_benchmarks(args.model, args.docs, args.repeat, args.seed)
+    if args.lexicon:
+        results["lexicon_strip_accents_mismatches"] = (
+            strip_accents_mismatches(lexicon_stems(utils.load_lexicon())))
+    if args.json:
+        sys.stdout.write(json.dumps(results, indent=2) + "\n")
+    else:
+        for name, value in results.items():
+            sys.stdout.write(f"{name:<36} {value:>16.6f}\n")
+
+
+if __name__ == "__main__":
+    main()
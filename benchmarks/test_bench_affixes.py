@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Smoke test of the benchmarks, run with `pytest benchmarks`."""
+import pytest
+
+
+@pytest.mark.benchmark
+def test_benchmarks():
+    from benchmarks.bench_affixes import run_benchmarks
+    results = run_benchmarks(docs=5, repeat=1)
+    assert results["matcher_init_s"] > 0
+    assert results["call_clitics_tokens_per_s"] > 0
+    assert results["eagles2ud_calls_per_s"] > 0
+    assert results["strip_accents_mismatches"] == 0
@@ -1,20 +1,109 @@
+import argparse
 import sys
 from .utils import download
 
 USAGE = """Usage:
-    python -m spacy_affixes download lang [version]
+    python -m spacy_affixes download lang [version] [options]
+    python -m spacy_affixes annotate input output [options]
+    python -m spacy_affixes prune input output [options]
 
-Parameters:
+Parameters for download:
 - lang. Two characters code for a language
 - version. (Optional) Version to use (defaults to '4.1')
+- Run `python -m spacy_affixes download --help` to see all the options,
+  such as downloading from a local mirror of Freeling
 
 For example, the default behaviour is:
     python -m spacy_affixes download es 4.1
+
+Parameters for annotate:
+- input. File with one doc per line, plain text or JSON lines with a "text"
+  field (if it ends in .jsonl). Use - for stdin
+- output. JSON lines file (use - for stdout) or, with `--format docbin`,
+  directory where serialized DocBin chunks are written
+- Run `python -m spacy_affixes annotate --help` to see all the options
+
+For example:
+    python -m spacy_affixes annotate corpus.txt corpus.jsonl --processes 4
+
+Parameters for prune:
+- input. Sample corpus, in the same formats as for annotate
+- output. JSON file with the affixes rules that produce analyses in the
+  sample corpus, to be passed as `AffixesMatcher(nlp, rules=...)`
+- Run `python -m spacy_affixes prune --help` to see all the options
+
+For example:
+    python -m spacy_affixes prune sample.txt affixes.json --min-count 2
 """
+
+
+def download_main(argv):
+    parser = argparse.ArgumentParser(prog="python -m spacy_affixes download")
+    parser.add_argument("lang")
+    parser.add_argument("version", nargs="?", default=None)
+    parser.add_argument("--base-url", default=None,
+                        help="Base URL or local directory of a Freeling "
+                             "mirror (defaults to $FREELINGURL or GitHub)")
+    parser.add_argument("--force", action="store_true",
+                        help="Download and build even if up to date")
+    args = parser.parse_args(argv)
+    download(lang=args.lang, version=args.version, base_url=args.base_url,
+             force=args.force)
+
+
+def annotate_main(argv):
+    from .annotate import annotate
+    parser = argparse.ArgumentParser(prog="python -m spacy_affixes annotate")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--model", default="es",
+                        help="SpaCy model to load (defaults to 'es')")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Number of processes (defaults to 1)")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="Docs per chunk sent to a process")
+    parser.add_argument("--format", choices=("jsonl", "docbin"),
+                        default="jsonl", help="Output format")
+    parser.add_argument("--input-format", choices=("jsonl", "text"),
+                        default=None, help="Input format")
+    parser.add_argument("--split-on", default=None,
+                        help="Comma separated UD POS to split tokens on")
+    args = parser.parse_args(argv)
+    split_on = None if args.split_on is None else args.split_on.split(",")
+    annotate(args.input, args.output, model=args.model,
+             processes=args.processes, batch_size=args.batch_size,
+             output_format=args.format, input_format=args.input_format,
+             split_on=split_on)
+
+
+def prune_main(argv):
+    from .prune import prune
+    parser = argparse.ArgumentParser(prog="python -m spacy_affixes prune")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--model", default="es",
+                        help="SpaCy model to load (defaults to 'es')")
+    parser.add_argument("--input-format", choices=("jsonl", "text"),
+                        default=None, help="Input format")
+    parser.add_argument("--min-count", type=int, default=1,
+                        help="Minimum number of analyses to keep a rule")
+    parser.add_argument("--batch-size", type=int, default=128,
+                        help="Docs per batch")
+    args = parser.parse_args(argv)
+    analyses = prune(args.input, args.output, model=args.model,
+                     input_format=args.input_format,
+                     min_count=args.min_count, batch_size=args.batch_size)
+    kept = sum(count >= args.min_count for count in analyses.values())
+    sys.stderr.write(f"Kept {kept} of {len(analyses)} rule keys\n")
+
+
 if __name__ == "__main__":
     argv_len = len(sys.argv)
-    if 2 <= argv_len <= 4 and sys.argv[1] == "download":
-        version = sys.argv[3] if argv_len == 4 else None
-        download(lang=sys.argv[2], version=version)
+    if argv_len >= 3 and sys.argv[1] == "download":
+        download_main(sys.argv[2:])
+    elif argv_len >= 2 and sys.argv[1] == "annotate":
+        annotate_main(sys.argv[2:])
+    elif argv_len >= 2 and sys.argv[1] == "prune":
+        prune_main(sys.argv[2:])
     else:
         sys.stdout.write(USAGE)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""Corpus annotation with a pool of processes."""
+import json
+import multiprocessing
+import os
+import sys
+from collections import deque
+from itertools import islice
+
+import spacy
+from spacy.tokens import DocBin
+
+from .main import AffixesMatcher
+
+ANNOTATE_JSONL = "jsonl"
+ANNOTATE_DOCBIN = "docbin"
+TOKEN_FIELDS = (
+    "has_affixes", "affixes_rule", "affixes_kind", "affixes_text",
+    "affixes_length",
+)
+# Pipeline loaded once per process and the (model, split_on) it was loaded
+# with. Forked workers inherit the one loaded by the parent, sharing the
+# memory-mapped lexicon pages
+_nlp = None
+_nlp_key = None
+
+
+def load_pipeline(model="es", split_on=None):
+    global _nlp, _nlp_key
+    key = (model, None if split_on is None else tuple(split_on))
+    if _nlp is None or _nlp_key != key:
+        nlp = spacy.load(model)
+        affixes_matcher = AffixesMatcher(nlp, split_on=split_on)
+        if nlp.has_pipe("tagger"):
+            nlp.add_pipe(affixes_matcher, name="affixes", before="tagger")
+        else:
+            nlp.add_pipe(affixes_matcher, name="affixes", first=True)
+        _nlp, _nlp_key = nlp, key
+    return _nlp
+
+
+def read_records(input_file, input_format=None):
+    """
+    Stream the records of an input file
+    :param input_file: File object with one doc per line
+    :param input_format: `"jsonl"` for JSON lines with a `"text"` field,
+                         anything else for plain text
+    :return: Generator of dictionaries with at least a `"text"` key
+    """
+    for line in input_file:
+        line = line.rstrip("\n")
+        if input_format == ANNOTATE_JSONL:
+            if line.strip():
+                yield json.loads(line)
+        else:
+            yield {"text": line}
+
+
+def doc_to_json(doc):
+    return [
+        {
+            "text": token.text,
+            "lemma": token.lemma_,
+            "pos": token.pos_,
+            "tag": token.tag_,
+            **{field: getattr(token._, field) for field in TOKEN_FIELDS},
+        } for token in doc
+    ]
+
+
+def annotate_chunk(chunk):
+    """
+    Annotate a chunk of records in the current process
+    :param chunk: Tuple with the chunk output format, batch size and records
+    :return: JSON lines as a string or serialized DocBin bytes
+    """
+    output_format, batch_size, records = chunk
+    docs = _nlp.pipe((record["text"] for record in records),
+                     batch_size=batch_size)
+    if output_format == ANNOTATE_DOCBIN:
+        doc_bin = DocBin(store_user_data=True)
+        for doc in docs:
+            doc_bin.add(doc)
+        return doc_bin.to_bytes()
+    lines = []
+    for record, doc in zip(records, docs):
+        lines.append(json.dumps(
+            {**record, "tokens": doc_to_json(doc)}, ensure_ascii=False
+        ))
+    return "".join(f"{line}\n" for line in lines)
+
+
+def chunked(records, size, output_format, batch_size):
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield output_format, batch_size, chunk
+
+
+def imap_bounded(pool, function, iterable, pending_size):
+    """
+    Ordered `pool.imap` that keeps at most `pending_size` pending tasks, so
+    the input is not read faster than it is processed
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(function, (item, )))
+        if len(pending) >= pending_size:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def annotate(input_path, output_path, model="es", processes=1,
+             batch_size=1000, output_format=ANNOTATE_JSONL,
+             input_format=None, split_on=None):
+    """
+    Annotate a corpus with a SpaCy model and `AffixesMatcher`, writing the
+    results incrementally and in the same order as the input
+    :param input_path: Path to the input, one doc per line. `-` for stdin
+    :param output_path: Path to the JSON lines output file (`-` for
+                        stdout) or to the directory where `DocBin` chunks
+                        are written
+    :param model: SpaCy model to load
+    :param processes: Number of processes to use
+    :param batch_size: Number of docs per chunk sent to a process
+    :param output_format: `"jsonl"` or `"docbin"`
+    :param input_format: `"jsonl"` or `"text"`. Defaults to `"jsonl"` for
+                         files ending in `.jsonl` and plain text otherwise
+    :param split_on: Tuple of UD POS to split tokens on
+    """
+    if input_format is None:
+        is_jsonl = input_path.endswith(f".{ANNOTATE_JSONL}")
+        input_format = ANNOTATE_JSONL if is_jsonl else "text"
+    load_pipeline(model, split_on)
+    if input_path == "-":
+        input_file = sys.stdin
+    else:
+        input_file = open(input_path, "r", encoding="utf-8")
+    if output_format == ANNOTATE_DOCBIN:
+        os.makedirs(output_path, exist_ok=True)
+        output_file = None
+    elif output_path == "-":
+        output_file = sys.stdout
+    else:
+        output_file = open(output_path, "w", encoding="utf-8")
+    chunks = chunked(read_records(input_file, input_format), batch_size,
+                     output_format, batch_size)
+    pool = None
+    if processes > 1:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            "fork" if "fork" in methods else None
+        )
+        pool = context.Pool(processes, initializer=load_pipeline,
+                            initargs=(model, split_on))
+        results = imap_bounded(pool, annotate_chunk, chunks, 2 * processes)
+    else:
+        results = map(annotate_chunk, chunks)
+    try:
+        for index, result in enumerate(results):
+            if output_file is None:
+                chunk_path = os.path.join(output_path, f"{index:08d}.spacy")
+                with open(chunk_path, "wb") as chunk_file:
+                    chunk_file.write(result)
+            else:
+                output_file.write(result)
+                output_file.flush()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file not in (None, sys.stdout):
+            output_file.close()
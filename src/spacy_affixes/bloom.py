@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Compact probabilistic membership filter."""
+import math
+import os
+import struct
+from hashlib import blake2b
+
+# File layout: header (magic, number of bits, hashes and items) and bits
+BLOOM_MAGIC = b"SPAFBLM1"
+BLOOM_HEADER = struct.Struct("<8sQII")
+DIGEST = struct.Struct("<QQ")
+
+
+class BloomFilter(object):
+
+    def __init__(self, capacity, error_rate=0.01, max_bytes=None):
+        """
+        Bloom filter over strings. Membership tests can give false
+        positives, with a probability of about `error_rate` once `capacity`
+        strings have been added, but never false negatives
+        :param capacity: Expected number of strings
+        :param error_rate: Target false positive rate
+        :param max_bytes: Maximum size in bytes of the bit array. If it is
+                          smaller than needed for `error_rate`, the false
+                          positive rate is higher
+        """
+        self.bits, self.hashes = self.size(capacity, error_rate, max_bytes)
+        self.items = 0
+        self.array = bytearray((self.bits + 7) // 8)
+
+    @staticmethod
+    def size(capacity, error_rate=0.01, max_bytes=None):
+        """
+        Optimal number of bits and hash functions of a filter
+        :return: Tuple with the number of bits and of hash functions
+        """
+        capacity = max(capacity, 1)
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        if max_bytes is not None:
+            bits = min(bits, 8 * max_bytes)
+        bits = max(bits, 8)
+        return bits, max(1, round(bits / capacity * math.log(2)))
+
+    @classmethod
+    def from_keys(cls, keys, error_rate=0.01, max_bytes=None):
+        """
+        Build a filter sized for a collection of strings
+        :param keys: Collection of strings, its length is the capacity
+        :param error_rate: Target false positive rate
+        :param max_bytes: Maximum size in bytes of the bit array
+        :return: `BloomFilter`
+        """
+        keys = keys if hasattr(keys, "__len__") else list(keys)
+        bloom_filter = cls(len(keys), error_rate, max_bytes)
+        bloom_filter.update(keys)
+        return bloom_filter
+
+    def positions(self, key):
+        digest = blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first, second = DIGEST.unpack(digest)
+        second |= 1
+        return [(first + index * second) % self.bits
+                for index in range(self.hashes)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.array[position >> 3] |= 1 << (position & 7)
+        self.items += 1
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key):
+        if not isinstance(key, str):
+            return False
+        array = self.array
+        for position in self.positions(key):
+            if not array[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def error_rate(self):
+        """Expected false positive rate for the strings added so far"""
+        return (1 - math.exp(-self.hashes * self.items / self.bits)
+                ) ** self.hashes
+
+    def to_bytes(self):
+        return BLOOM_HEADER.pack(BLOOM_MAGIC, self.bits, self.hashes,
+                                 self.items) + bytes(self.array)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, bits, hashes, items = BLOOM_HEADER.unpack_from(data)
+        if magic != BLOOM_MAGIC:
+            raise ValueError("Data is not a serialized Bloom filter")
+        bloom_filter = cls.__new__(cls)
+        bloom_filter.bits = bits
+        bloom_filter.hashes = hashes
+        bloom_filter.items = items
+        bloom_filter.array = bytearray(data[BLOOM_HEADER.size:])
+        return bloom_filter
+
+    def write(self, path):
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as dump:
+            dump.write(self.to_bytes())
+        os.replace(temp_path, path)
+
+    @classmethod
+    def read(cls, path):
+        with open(path, "rb") as dump:
+            return cls.from_bytes(dump.read())
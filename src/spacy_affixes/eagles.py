@@ -1,4 +1,10 @@
 import re
+from functools import lru_cache
+
+# The EAGLES tagset is finite, a few thousand entries cover it
+EAGLES_CACHE_SIZE = 4096
+# Precomputed (UD POS, UD tags) pairs keyed by EAGLES tag
+EAGLES_TABLE = {}
 
 adjective_dict = {
     1: ["NumType", "Poss"],
@@ -208,6 +214,7 @@ category_dict = {
 }
 
 
+@lru_cache(maxsize=EAGLES_CACHE_SIZE)
 def eagles2ud(eagle):
     if category_dict.get(eagle[0], None) is None:
         return 'X__X'
@@ -253,3 +260,30 @@ def eagles2ud(eagle):
                     tag += "|Poss=Yes"
                 break
     return f"{pos}__{'|'.join(sorted(tag[1:].split('|')))}"
+
+
+@lru_cache(maxsize=EAGLES_CACHE_SIZE)
+def eagles2pos_tags(eagle):
+    """
+    Transform an EAGLES tag into its UD POS and UD features
+    :param eagle: EAGLES tag to be converted
+    :return: Tuple with the UD POS and the UD features
+    """
+    pos_tags = EAGLES_TABLE.get(eagle)
+    if pos_tags is None:
+        pos, tags = eagles2ud(eagle).split("__", 1)
+        pos_tags = (pos, tags)
+    return pos_tags
+
+
+def precompute_eagles(eagles):
+    """
+    Fill the precomputed EAGLES table with the conversions of a set of tags,
+    for example all the EAGLES tags used in a lexicon
+    :param eagles: Iterable of EAGLES tags
+    :return: The precomputed table
+    """
+    for eagle in eagles:
+        if eagle not in EAGLES_TABLE:
+            EAGLES_TABLE[eagle] = eagles2pos_tags(eagle)
+    return EAGLES_TABLE
@@ -0,0 +1,537 @@
+# -*- coding: utf-8 -*-
+"""Compact binary lexicon format."""
+import atexit
+import hashlib
+import heapq
+import marshal
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from collections.abc import Mapping
+from contextlib import ExitStack
+from functools import partial
+from operator import itemgetter
+
+# File layout, all integers are little-endian unsigned 32 bits:
+# - Header: magic, number of strings, words, analyses and string pool size
+# - String offsets: `n_strings + 1` offsets into the string pool
+# - Words: `n_words + 1` pairs of (word string id, first analysis index),
+#          sorted by the UTF-8 bytes of the word
+# - Analyses: `n_analyses` rows of (lemma, eagle, ud, tags) string ids
+# - String pool: UTF-8 encoded strings, words and interned values
+LEXICON_MAGIC = b"SPAFLEX1"
+LEXICON_HEADER = struct.Struct("<8s4I")
+LEXICON_FIELDS = ("lemma", "eagle", "ud", "tags")
+# Number of entries sorted in memory at once when writing a lexicon
+LEXICON_CHUNK_SIZE = 100000
+# Binary lexicons opened in this process keyed by absolute path
+ATTACHED_LEXICONS = {}
+# Temporary files written by `share_lexicon` keyed by content digest
+TEMPORARY_LEXICONS = {}
+
+
+def write_binary_lexicon(path, lexicon, chunk_size=LEXICON_CHUNK_SIZE):
+    """
+    Serialize a lexicon into the binary format read by `BinaryLexicon`
+    :param path: Path of the file to write
+    :param lexicon: Mapping keyed by word with lists of analyses, each one a
+                    dictionary with values for lemma, EAGLE code, UD POS,
+                    and UD Tags
+    :param chunk_size: Number of entries sorted in memory at once
+    """
+    write_binary_entries(path, (
+        (word, analysis)
+        for word in lexicon for analysis in lexicon[word]
+    ), chunk_size)
+
+
+def write_binary_entries(path, entries, chunk_size=LEXICON_CHUNK_SIZE):
+    """
+    Serialize a stream of lexicon entries into the binary format read by
+    `BinaryLexicon`. Entries are sorted in chunks spilled to temporary
+    files and then merged, so memory use is bounded by `chunk_size` and
+    the number of distinct analysis values, not by the number of entries
+    :param path: Path of the file to write
+    :param entries: Iterable of tuples `(word, analysis)` in any order. The
+                    analyses of a word keep their relative order
+    :param chunk_size: Number of entries sorted in memory at once
+    """
+    with ExitStack() as stack:
+        runs = sorted_runs(entries, chunk_size, stack)
+        offsets, words, analyses = (
+            stack.enter_context(Uint32Spool(chunk_size)) for _ in range(3)
+        )
+        pool = stack.enter_context(tempfile.TemporaryFile())
+        pool_size = 0
+        offsets.extend((0, ))
+        strings = {}
+
+        def add_string(string):
+            nonlocal pool_size
+            string_id = len(offsets) - 1
+            pool.write(string)
+            pool_size += len(string)
+            offsets.extend((pool_size, ))
+            return string_id
+
+        previous = None
+        for word, *fields in heapq.merge(*runs, key=itemgetter(0)):
+            if word != previous:
+                word_id = add_string(word)
+                words.extend((word_id, len(analyses) // 4))
+                previous = word
+            for field in fields:
+                if field == word:
+                    # Most lemmas of the base forms are the words themselves
+                    analyses.extend((word_id, ))
+                    continue
+                string_id = strings.get(field)
+                if string_id is None:
+                    string_id = strings[field] = add_string(field)
+                analyses.extend((string_id, ))
+        words.extend((0, len(analyses) // 4))
+        # Write to a temporary file and then replace, so processes with the
+        # previous file mapped keep reading consistent data
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as dump:
+            dump.write(LEXICON_HEADER.pack(LEXICON_MAGIC, len(offsets) - 1,
+                                           len(words) // 2 - 1,
+                                           len(analyses) // 4, pool_size))
+            for table in (offsets, words, analyses):
+                table.copy_to(dump)
+            pool.seek(0)
+            shutil.copyfileobj(pool, dump)
+    os.replace(temp_path, path)
+    ATTACHED_LEXICONS.pop(os.path.abspath(path), None)
+
+
+def sorted_runs(entries, chunk_size, stack):
+    """
+    Encode lexicon entries and split them into runs sorted by word
+    :param entries: Iterable of tuples `(word, analysis)`
+    :param chunk_size: Number of entries per run. All the runs but the
+                       last one are spilled to temporary files
+    :param stack: `ExitStack` the temporary files are closed with
+    :return: List of iterables of tuples with the UTF-8 encoded word and
+             analysis fields
+    """
+    runs = []
+    chunk = []
+    for word, analysis in entries:
+        chunk.append((word.encode("utf-8"), *(
+            (analysis[field] or "").encode("utf-8")
+            for field in LEXICON_FIELDS
+        )))
+        if len(chunk) >= chunk_size:
+            chunk.sort(key=itemgetter(0))
+            run_file = stack.enter_context(tempfile.TemporaryFile())
+            for record in chunk:
+                marshal.dump(record, run_file)
+            run_file.seek(0)
+            runs.append(read_run(run_file))
+            chunk = []
+    chunk.sort(key=itemgetter(0))
+    runs.append(chunk)
+    return runs
+
+
+def read_run(run_file):
+    while True:
+        try:
+            yield marshal.load(run_file)
+        except EOFError:
+            return
+
+
+class Uint32Spool(object):
+
+    def __init__(self, chunk_size):
+        """
+        Append-only table of little-endian unsigned 32 bits integers kept
+        in a temporary file, with at most `chunk_size` of them in memory
+        :param chunk_size: Number of integers buffered before writing
+        """
+        self.file = tempfile.TemporaryFile()
+        self.chunk_size = chunk_size
+        self.buffer = array("I")
+        self.length = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.file.close()
+
+    def __len__(self):
+        return self.length + len(self.buffer)
+
+    def extend(self, values):
+        self.buffer.extend(values)
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if sys.byteorder != "little":
+            self.buffer.byteswap()
+        self.buffer.tofile(self.file)
+        self.length += len(self.buffer)
+        self.buffer = array("I")
+
+    def copy_to(self, output):
+        self.flush()
+        self.file.seek(0)
+        shutil.copyfileobj(self.file, output)
+
+
+def lookup_category(lexicon, word, category):
+    """
+    Analyses of a word whose EAGLES tags start with a category prefix
+    :param lexicon: Mapping keyed by word with lists of analyses
+    :param word: Word to look for
+    :param category: Uppercased EAGLES category prefix, (ex. `"VM"`)
+    :return: List of analyses in lexicon order
+    """
+    lookup = getattr(lexicon, "lookup", None)
+    if lookup is not None:
+        return lookup(word, category)
+    return [
+        analysis for analysis in lexicon.get(word, ())
+        if analysis["eagle"][:len(category)].upper() == category
+    ]
+
+
+def lexicon_eagles(lexicon):
+    """
+    Distinct EAGLES tags of the analyses of a lexicon
+    :param lexicon: Mapping keyed by word with lists of analyses
+    :return: Set of EAGLES tags
+    """
+    if isinstance(lexicon, LazyLexicon):
+        lexicon = lexicon.load()
+    field_values = getattr(lexicon, "field_values", None)
+    if field_values is not None:
+        return field_values("eagle")
+    return {analysis["eagle"]
+            for analyses in lexicon.values() for analysis in analyses}
+
+
+def attach_lexicon(path):
+    """
+    Open a binary lexicon only once per process. Forked processes inherit
+    the mapping and unpickled lexicons attach to the already opened one
+    :param path: Path to a lexicon file written by `write_binary_lexicon`
+    :return: `BinaryLexicon`
+    """
+    path = os.path.abspath(path)
+    lexicon = ATTACHED_LEXICONS.get(path)
+    if lexicon is None:
+        lexicon = ATTACHED_LEXICONS[path] = BinaryLexicon(path)
+    return lexicon
+
+
+def share_lexicon(lexicon, path=None):
+    """
+    Turn any lexicon into a memory-mapped `BinaryLexicon`, whose pages are
+    shared by all the processes using it instead of being copied
+    :param lexicon: Mapping keyed by word with lists of analyses
+    :param path: Path of the binary file to write if `lexicon` is not
+                 already a `BinaryLexicon`. Defaults to a temporary file,
+                 shared by lexicons with the same content and removed at
+                 exit
+    :return: `BinaryLexicon`
+    """
+    if isinstance(lexicon, LazyLexicon):
+        lexicon = lexicon.load()
+    if isinstance(lexicon, BinaryLexicon):
+        return lexicon
+    if path is not None:
+        write_binary_lexicon(path, lexicon)
+        return attach_lexicon(path)
+    file_descriptor, path = tempfile.mkstemp(
+        prefix="spacy-affixes-lexicon-", suffix=".bin"
+    )
+    os.close(file_descriptor)
+    write_binary_lexicon(path, lexicon)
+    digest = file_checksum(path)
+    shared_path = TEMPORARY_LEXICONS.get(digest)
+    if shared_path is None:
+        TEMPORARY_LEXICONS[digest] = path
+        atexit.register(remove_temporary_lexicon, path, os.getpid())
+    else:
+        os.remove(path)
+        path = shared_path
+    return attach_lexicon(path)
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for chunk in iter(partial(source.read, 1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def remove_temporary_lexicon(path, pid):
+    # Forked processes share the file with the one that wrote it
+    if os.getpid() == pid:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def uint32_table(buffer, start, count):
+    """
+    View `count` little-endian unsigned integers of `buffer` from `start`
+    """
+    view = memoryview(buffer)[start:start + 4 * count]
+    if sys.byteorder == "little":
+        return view.cast("I")
+    table = array("I", view.tobytes())
+    table.byteswap()
+    return table
+
+
+class BinaryLexicon(Mapping):
+
+    def __init__(self, path):
+        """
+        Read-only mapping from words to analyses backed by a memory-mapped
+        file, so the pages are shared by all the processes that open it and
+        entries are only decoded when accessed
+        :param path: Path to a lexicon file written by `write_binary_lexicon`
+        """
+        self.path = path
+        with open(path, "rb") as lexicon_file:
+            self.buffer = mmap.mmap(
+                lexicon_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        (magic, n_strings, n_words, n_analyses,
+         pool_size) = LEXICON_HEADER.unpack_from(self.buffer)
+        if magic != LEXICON_MAGIC:
+            raise ValueError(f"{path} is not a binary lexicon file")
+        position = LEXICON_HEADER.size
+        self.offsets = uint32_table(self.buffer, position, n_strings + 1)
+        position += 4 * (n_strings + 1)
+        self.words = uint32_table(self.buffer, position, 2 * (n_words + 1))
+        position += 8 * (n_words + 1)
+        self.analyses = uint32_table(self.buffer, position, 4 * n_analyses)
+        position += 16 * n_analyses
+        self.pool = position
+        self.length = n_words
+
+    def __reduce__(self):
+        return attach_lexicon, (self.path, )
+
+    def string_bytes(self, string_id):
+        start = self.pool + self.offsets[string_id]
+        end = self.pool + self.offsets[string_id + 1]
+        return self.buffer[start:end]
+
+    def string(self, string_id):
+        return self.string_bytes(string_id).decode("utf-8")
+
+    def find(self, word):
+        """
+        Binary search a word
+        :param word: Word to look for
+        :return: Index of the word in the words table or -1 if missing
+        """
+        if not isinstance(word, str):
+            return -1
+        key = word.encode("utf-8")
+        low, high = 0, self.length
+        while low < high:
+            middle = (low + high) // 2
+            current = self.string_bytes(self.words[2 * middle])
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                return middle
+        return -1
+
+    def analysis(self, row):
+        return {
+            field: self.string(self.analyses[row + column])
+            for column, field in enumerate(LEXICON_FIELDS)
+        }
+
+    def entry(self, index):
+        start, end = self.words[2 * index + 1], self.words[2 * index + 3]
+        return [self.analysis(row) for row in range(4 * start, 4 * end, 4)]
+
+    def lookup(self, word, category):
+        """
+        Analyses of a word whose EAGLES tags start with a category prefix,
+        decoding only those
+        :param word: Word to look for
+        :param category: Uppercased EAGLES category prefix, (ex. `"VM"`)
+        :return: List of analyses in lexicon order
+        """
+        index = self.find(word)
+        if index < 0:
+            return []
+        key = category.encode("utf-8")
+        start, end = self.words[2 * index + 1], self.words[2 * index + 3]
+        return [
+            self.analysis(row) for row in range(4 * start, 4 * end, 4)
+            if self.string_bytes(
+                self.analyses[row + 1])[:len(key)].upper() == key
+        ]
+
+    def field_values(self, field):
+        """
+        Distinct values of a field of the analyses, decoding each once
+        :param field: One of `LEXICON_FIELDS`
+        :return: Set of strings
+        """
+        column = LEXICON_FIELDS.index(field)
+        return {self.string(string_id)
+                for string_id in set(self.analyses[column::4])}
+
+    def __contains__(self, word):
+        return self.find(word) >= 0
+
+    def __getitem__(self, word):
+        index = self.find(word)
+        if index < 0:
+            raise KeyError(word)
+        return self.entry(index)
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield self.string(self.words[2 * index])
+
+    def __len__(self):
+        return self.length
+
+
+class LazyLexicon(Mapping):
+
+    def __init__(self, loader):
+        """
+        Lexicon proxy that defers loading until the first lookup
+        :param loader: Callable with no arguments returning the lexicon
+        """
+        self.loader = loader
+        self.lexicon = None
+
+    def load(self):
+        if self.lexicon is None:
+            self.lexicon = self.loader()
+        return self.lexicon
+
+    def lookup(self, word, category):
+        return lookup_category(self.load(), word, category)
+
+    def __contains__(self, word):
+        return word in self.load()
+
+    def __getitem__(self, word):
+        return self.load()[word]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+
+class FilteredLexicon(Mapping):
+
+    def __init__(self, lexicon, words_filter):
+        """
+        Lexicon proxy that rejects most missing words with a membership
+        filter before looking them up, so their lookups touch neither the
+        lexicon pages nor its entries
+        :param lexicon: Mapping keyed by word with lists of analyses
+        :param words_filter: Membership filter, such as a `BloomFilter`,
+                             with no false negatives for the lexicon words
+        """
+        self.lexicon = lexicon
+        self.filter = words_filter
+
+    def lookup(self, word, category):
+        if word not in self.filter:
+            return []
+        return lookup_category(self.lexicon, word, category)
+
+    def __contains__(self, word):
+        return word in self.filter and word in self.lexicon
+
+    def __getitem__(self, word):
+        if word not in self.filter:
+            raise KeyError(word)
+        return self.lexicon[word]
+
+    def __iter__(self):
+        return iter(self.lexicon)
+
+    def __len__(self):
+        return len(self.lexicon)
+
+
+class FoldedLexicon(Mapping):
+
+    def __init__(self, lexicon, fold):
+        """
+        Lexicon proxy with an index from accent-folded forms to the words
+        that fold to them, so a stem whose accents were stripped finds the
+        words it comes from. The index is built on first use and only
+        holds the words changed by folding
+        :param lexicon: Mapping keyed by word with lists of analyses
+        :param fold: Callable folding the accents of a string
+        """
+        self.lexicon = lexicon
+        self.fold = fold
+        self.index = None
+
+    def __reduce__(self):
+        return FoldedLexicon, (self.lexicon, self.fold)
+
+    def build_index(self):
+        if self.index is None:
+            index = {}
+            for word in self.lexicon:
+                folded = self.fold(word)
+                if folded != word:
+                    index.setdefault(folded, []).append(word)
+            self.index = {folded: tuple(sorted(words))
+                          for folded, words in index.items()}
+        return self.index
+
+    def unfold(self, folded, written=None):
+        """
+        Words of the lexicon that fold to a string
+        :param folded: Accent-folded string
+        :param written: String before folding, preferred over any other
+                        word folding to the same string
+        :return: Tuple of words, `folded` first if it is in the lexicon
+        """
+        words = self.build_index().get(folded, ())
+        if written in words:
+            words = (written, *(word for word in words if word != written))
+        if folded in self.lexicon:
+            return (folded, *words)
+        return words
+
+    def lookup(self, word, category):
+        return lookup_category(self.lexicon, word, category)
+
+    def __contains__(self, word):
+        return word in self.lexicon
+
+    def __getitem__(self, word):
+        return self.lexicon[word]
+
+    def __iter__(self):
+        return iter(self.lexicon)
+
+    def __len__(self):
+        return len(self.lexicon)
@@ -1,21 +1,66 @@
 # -*- coding: utf-8 -*-
 """Main module."""
-import re
+from collections import Counter
+from collections import OrderedDict
+from collections import defaultdict
+from collections import namedtuple
+from itertools import chain
+from time import perf_counter
 
-from spacy.matcher import Matcher
+import numpy
+from spacy.attrs import IS_ALPHA
+from spacy.attrs import LENGTH
+from spacy.attrs import LIKE_NUM
+from spacy.attrs import LOWER
+from spacy.parts_of_speech import IDS as POS_IDS
 from spacy.tokens import Token
+from spacy.util import minibatch
 
+from .eagles import precompute_eagles
+from .lexicon import FilteredLexicon
+from .lexicon import FoldedLexicon
+from .lexicon import lexicon_eagles
+from .lexicon import share_lexicon
+from .rules import AffixRule
+from .rules import compile_affixes
+from .trie import AffixesTrie
 from .utils import AFFIXES_SUFFIX
+from .utils import build_lexicon_filter
 from .utils import get_morfo
-from .utils import load_affixes
+from .utils import load_bundle
 from .utils import load_lexicon
+from .utils import load_lexicon_filter
+from .utils import fold_accents as fold_accents_string
 from .utils import token_transform
 
+# Token attributes used to select the candidate tokens of a doc
+MATCH_ATTRS = (LOWER, LENGTH, IS_ALPHA, LIKE_NUM)
+# Analysis of a token ready to be applied: the rule key, the kind of affix,
+# the split pieces and heads (empty if the token is not split), the UD POS
+# and tags, the lemma (`None` to keep it), the text without the affix
+# (after transformations), the number of affixes, and the POS symbol and
+# the tags and lemma hashes in the vocab strings, to assign them directly
+Resolution = namedtuple("Resolution", (
+    "rule_key", "kind", "pieces", "heads", "pos", "tags", "lemma", "text",
+    "length", "pos_id", "tags_id", "lemma_id",
+))
+
+
+def register_extensions():
+    if not Token.has_extension("has_affixes"):
+        Token.set_extension("has_affixes", default=False)
+        Token.set_extension("affixes_kind", default=None)
+        Token.set_extension("affixes_lemma", default=None)
+        Token.set_extension("affixes_length", default=0)
+        Token.set_extension("affixes_rule", default=None)
+        Token.set_extension("affixes_text", default=None)
+
 
 class AffixesMatcher(object):
 
     def __init__(self, nlp, rules=None, lexicon=None, split_on=None,
-                 replace_lemmas=True):
+                 replace_lemmas=True, cache_size=65536, shared=False,
+                 instrument=False, lexicon_filter=None, fold_accents=False):
         """
         :param nlp: SpaCy NLP object with the language already loaded
         :param rules: Dictionary of rules for affixes handling. Each dict
@@ -44,8 +89,10 @@ class AffixesMatcher(object):
                       `python -m spacy_affixes download <lang> [version]`.
                       Please, check the Freeling site to see license
                       compatibilities.
-        :param lexicon: Dictionary keyed by word with values for lemma,
-                        EAGLE code, UD POS, and UD Tags. It defaults to
+        :param lexicon: Dictionary (or any mapping, such as the
+                        memory-mapped `BinaryLexicon`) keyed by word with
+                        values for lemma, EAGLE code, UD POS, and UD Tags.
+                        It defaults to
                         Freeling if installed (environment
                         variable `FREELINGDIR` should be set) or downloaded
                         using
@@ -56,10 +103,61 @@ class AffixesMatcher(object):
                          verbs. A `*` means split whenever possible.
         :param replace_lemmas: Boolean specifying whether the lemma should be
                                replaced with the output of the Freeling rules
+        :param cache_size: Maximum number of token analyses (or lack of
+                           them) kept in the least recently used cache keyed
+                           by token text and rule key. `0` disables it
+        :param shared: Boolean specifying whether the lexicon and rules
+                       should be loaded once per process, with the lexicon
+                       as a memory-mapped file. Processes forked after
+                       creating the matcher (ex. `nlp.pipe(n_process=4)`)
+                       and unpickled matchers share the same lexicon pages
+                       instead of holding private copies
+        :param instrument: Boolean specifying whether to record timings and
+                           counters of the matcher phases and rules, as
+                           returned by `stats()`
+        :param lexicon_filter: Membership filter of the lexicon words, such
+                               as a `BloomFilter`, checked before looking
+                               words up in the lexicon to reject most of
+                               the missing ones. `True` uses the one stored
+                               with the default lexicon (or builds one for
+                               the given lexicon)
+        :param fold_accents: Boolean specifying whether stems of rules
+                             stripping accents should be looked up through
+                             an index of the accent-folded forms of the
+                             lexicon words, built on first use (or when
+                             creating the matcher if `shared`). Otherwise
+                             the stem is tried stripped and then as written
         """
         self.nlp = nlp
-        self.rules = load_affixes() if rules is None else rules
-        self.lexicon = load_lexicon() if lexicon is None else lexicon
+        matcher = None
+        if rules is None:
+            # Precompiled rules and trie
+            bundle = load_bundle(shared=shared)
+            self.rules, matcher = bundle["rules"], bundle["trie"]
+        else:
+            # Already compiled rules are reused, not copied
+            self.rules = compile_affixes(rules)
+        if lexicon_filter is True:
+            lexicon_filter = (load_lexicon_filter() if lexicon is None
+                              else build_lexicon_filter(lexicon))
+        if isinstance(lexicon, FoldedLexicon):
+            fold_accents, lexicon = True, lexicon.lexicon
+        if lexicon is not None:
+            # Bundles only cover the tags of the default lexicon
+            precompute_eagles(lexicon_eagles(lexicon))
+        if lexicon is None:
+            lexicon = load_lexicon(lazy=not shared)
+        elif shared:
+            lexicon = share_lexicon(lexicon)
+        if lexicon_filter is not None:
+            lexicon = FilteredLexicon(lexicon, lexicon_filter)
+        self.lexicon = lexicon
+        self.folded_lexicon = None
+        if fold_accents:
+            self.folded_lexicon = FoldedLexicon(lexicon, fold_accents_string)
+            if shared:
+                # Built before forking so workers inherit it
+                self.folded_lexicon.build_index()
         self.split_on = ("VERB", ) if split_on is None else split_on
         try:
             lemma_lookup = self.nlp.vocab.lookups.get_table("lemma_lookup")
@@ -68,6 +166,20 @@ class AffixesMatcher(object):
             lemma_lookup = {}
         self.lemma_lookup = lemma_lookup
         self.replace_lemmas = replace_lemmas
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Rule keys tried and producing an analysis, to rank them
+        self.rule_attempts = Counter()
+        self.rule_successes = Counter()
+        # Fixed order of the rule keys whose affixes have the same length,
+        # so analyses do not depend on the tokens seen before
+        self.rule_ranks = {
+            rule_key: rank for rank, rule_key in enumerate(self.rules)
+        }
+        self.instrument = instrument
+        self.reset_stats()
         if None in (self.lexicon, self.rules):
             raise ValueError("""
             Data for affixes rules or lexicon data is missing. Check
@@ -78,99 +190,420 @@ class AffixesMatcher(object):
             Please, check the Freeling site to see license
             compatibilities.
             """)
-        if not Token.has_extension("has_affixes"):
-            Token.set_extension("has_affixes", default=False)
-            Token.set_extension("affixes_kind", default=None)
-            Token.set_extension("affixes_lemma", default=None)
-            Token.set_extension("affixes_length", default=0)
-            Token.set_extension("affixes_rule", default=None)
-            Token.set_extension("affixes_text", default=None)
-        self.matcher = Matcher(nlp.vocab)
-        for rule_key, rules in self.rules.items():
-            for rule in rules:
-                self.matcher.add(rule_key, None, [
-                    {"TEXT": {"REGEX": fr"(?i){rule['pattern']}"}},
-                    # It'd be nice if we could check regex AND minimum length
-                    # {"LENGTH": {">": len(rule_key)}},
-                ])
+        register_extensions()
+        self.matcher = matcher or AffixesTrie(self.rules)
 
-    def apply_rules(self, retokenizer, token, rule):
-        if (rule["always_apply"]
-                or (token.is_oov or token not in self.lexicon)) is False:
-            return
-        strip_accent_exceptions = (
-            "automática",
-        )
-        for affix_add in rule["affix_add"]:
-            strip_accent = rule["strip_accent"]
-            token_sub = re.sub(rule["pattern"], '', token.text)
-            token_left = token_transform(
-                token_sub,
-                affix_add,
-                False if token_sub in strip_accent_exceptions else strip_accent
-            )
-            morfo_lemma_opts = {
-                "affix_text": "".join(rule["affix_text"]),
-                "token_lower": token.lower_,
-                "token_left": token_left,
-            }
-            morfo = get_morfo(
-                token_left.lower(),
-                self.lexicon,
-                re.compile(rule["pos_re"], re.I),
-                rule["assign_pos"],
-                rule["assign_lemma"],
-                **morfo_lemma_opts
-            )
-            if token_left and morfo and not token._.has_affixes:
-                _, token_ud, token_tags, token_lemma = morfo
-                affixes_length = (
-                    len(rule["affix_text"]) or int(affix_add != "")
+    def __setstate__(self, state):
+        # Unpickled matchers, as in spawned processes, need the extensions
+        self.__dict__.update(state)
+        register_extensions()
+
+    def is_unknown(self, token):
+        """
+        Whether a token is not a known word, so every rule applies to it and
+        not only the ones marked as `always_apply`. Known words are the ones
+        in the lexicon, `token.is_oov` only tells whether SpaCy has a
+        vector for the token and it is true for every token in models
+        without vectors
+        :param token: SpaCy token
+        :return: Boolean
+        """
+        return token.lower_ not in self.lexicon
+
+    def resolve_rule(self, token, rule, rule_key=None, unknown=None):
+        """
+        Find the analysis of a token according to a single rule
+        :param token: SpaCy token matching the rule affix
+        :param rule: Rule dictionary
+        :param rule_key: Key of the rule in `self.rules`
+        :param unknown: Whether the token is unknown, as returned by
+                        `is_unknown`. Computed if `None`
+        :return: `Resolution` of the token or `None`
+        """
+        if not rule.always_apply:
+            if unknown is None:
+                unknown = self.is_unknown(token)
+            if not unknown:
+                return None
+        token_sub = rule.regex.sub('', token.text)
+        for affix_add in rule.affix_add:
+            written = token_transform(token_sub, affix_add, False)
+            if not written:
+                continue
+            lefts = {written.lower(): written}
+            if rule.strip_accent:
+                stripped = token_transform(token_sub, affix_add, True)
+                lefts[stripped.lower()] = stripped
+            if not rule.strip_accent:
+                words = (written.lower(), )
+            elif self.folded_lexicon is not None:
+                # Words whose accent-folded form is the one of the stem, the
+                # stem as written first if there are several
+                words = self.folded_lexicon.unfold(stripped.lower(),
+                                                   written.lower())
+            else:
+                # The stem as written is tried if the stripped one fails
+                words = tuple(dict.fromkeys((stripped.lower(),
+                                             written.lower())))
+            for word in words:
+                token_left = lefts.get(word, word)
+                morfo_lemma_opts = {
+                    "affix_text": rule.affix_text_joined,
+                    "token_lower": token.lower_,
+                    "token_left": token_left,
+                }
+                if self.instrument:
+                    self.counters["lexicon_lookups"] += 1
+                morfo = get_morfo(
+                    word,
+                    self.lexicon,
+                    None if rule.pos_exact else rule.pos_regex,
+                    rule.assign_pos,
+                    rule.lemma_template,
+                    category=rule.pos_category,
+                    **morfo_lemma_opts
                 )
-                if rule["kind"] == AFFIXES_SUFFIX:
-                    heads = [(token, 1)] + (affixes_length * [(token, 0)])
-                    token.lemma_ = self.lemma_lookup.get(
-                        token_left.lower(),
-                        token_lemma
+                if morfo:
+                    return self.build_resolution(
+                        rule_key, rule, affix_add, token_sub, token_left,
+                        morfo
                     )
-                else:
-                    heads = (affixes_length * [(token, 0)]) + [(token, 1)]
-                if "*" in self.split_on or token_ud in self.split_on:
-                    if rule["kind"] == AFFIXES_SUFFIX:
-                        retokenizer.split(
-                            token, [token_sub, *rule["affix_text"]], heads
-                        )
-                    else:
-                        retokenizer.split(
-                            token, [*rule["affix_text"], token_sub], heads
-                        )
-                token.pos_ = token_ud
-                if token_tags:
-                    token.tag_ = token_tags
-                token._.affixes_text = token_left
-                token._.affixes_kind = rule["kind"]
-                token._.affixes_length = affixes_length
-                token._.affixes_lemma = token.lemma_
-                token._.has_affixes = True
+        return None
 
-    def __call__(self, doc):
-        matches = self.matcher(doc)
+    def build_resolution(self, rule_key, rule, affix_add, token_sub,
+                         token_left, morfo):
+        _, token_ud, token_tags, token_lemma = morfo
+        affixes_length = (
+            len(rule.affix_text) or int(affix_add != "")
+        )
+        if rule.kind == AFFIXES_SUFFIX:
+            pieces = (token_sub, *rule.affix_text)
+            heads = (1, ) + (affixes_length * (0, ))
+            lemma = self.lemma_lookup.get(token_left.lower(), token_lemma)
+        else:
+            pieces = (*rule.affix_text, token_sub)
+            heads = (affixes_length * (0, )) + (1, )
+            lemma = None
+        if not ("*" in self.split_on or token_ud in self.split_on):
+            pieces, heads = (), ()
+        strings = self.nlp.vocab.strings
+        return Resolution(
+            rule_key, rule.kind, pieces, heads, token_ud, token_tags, lemma,
+            token_left, affixes_length, POS_IDS[token_ud],
+            strings.add(token_tags) if token_tags else None,
+            None if lemma is None else strings.add(lemma),
+        )
+
+    def resolve_rules(self, token, rule_key, unknown=None):
+        """
+        Find the analysis of a token according to the first rule of
+        `rule_key` that produces one
+        :param token: SpaCy token matching the rule affix
+        :param rule_key: Key of the rules in `self.rules`
+        :param unknown: Whether the token is unknown, as returned by
+                        `is_unknown`. Computed if `None`
+        :return: `Resolution` of the token or `None`
+        """
+        for rule in self.rules[rule_key]:
+            resolution = self.resolve_rule(token, rule, rule_key, unknown)
+            if resolution is not None:
+                return resolution
+        return None
+
+    def resolve_candidates(self, token, rule_keys):
+        """
+        Find the analysis of a token according to the first of the
+        candidate rule keys that produces one, keeping count of the
+        attempts and successes of each rule key
+        :param token: SpaCy token matching the rules affixes
+        :param rule_keys: Tuple of rule keys as returned by `schedule`
+        :return: `Resolution` of the token or `None`
+        """
+        # Checked once, before any rule work
+        unknown = self.is_unknown(token)
+        for rule_key in rule_keys:
+            self.rule_attempts[rule_key] += 1
+            resolution = self.resolve_rules(token, rule_key, unknown)
+            if resolution is not None:
+                self.rule_successes[rule_key] += 1
+                return resolution
+        return None
+
+    def schedule(self, candidates):
+        """
+        Order the candidate rule keys of a token: longest affix first and,
+        for affixes of the same length, by `rule_ranks`
+        :param candidates: List of tuples `(affix length, rule key)` as
+                           returned by `AffixesTrie.candidates`
+        :return: Tuple of rule keys
+        """
+        if len(candidates) > 1:
+            ranks = self.rule_ranks
+            candidates = sorted(candidates, key=lambda candidate: (
+                -candidate[0], ranks.get(candidate[1], len(ranks))
+            ))
+        return tuple(rule_key for _, rule_key in candidates)
+
+    def freeze_schedule(self):
+        """
+        Rank the rule keys by the rate of analyses they produced so far,
+        (ex. after a warm-up on a sample of the corpus), so rules of the
+        same affix length that succeed more often are tried first from then
+        on. The ranks are kept until called again, and are copied to the
+        workers along with the matcher
+        :return: Dictionary of ranks keyed by rule key
+        """
+        self.rule_ranks = {
+            rule_key: rank for rank, rule_key in enumerate(sorted(
+                self.rules, key=lambda rule_key: (
+                    -self.rule_successes[rule_key]
+                    / (self.rule_attempts[rule_key] or 1),
+                    self.rule_ranks.get(rule_key, len(self.rule_ranks))
+                )
+            ))
+        }
+        # Cached resolutions are keyed by the previous order
+        self.cache.clear()
+        return self.rule_ranks
+
+    def resolve_cached(self, token, rule_keys):
+        """
+        Same as `resolve_candidates` but going through the resolutions cache
+        """
+        key = (token.text, rule_keys)
+        if key in self.cache:
+            self.cache_hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        self.cache_misses += 1
+        resolution = self.resolve_candidates(token, rule_keys)
+        if self.cache_size:
+            self.cache[key] = resolution
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return resolution
+
+    def clear_cache(self):
+        """
+        Empty the resolutions cache and reset its counters. Needed after
+        changing the rules, the lexicon, `split_on` or the lemma lookups
+        """
+        self.cache.clear()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.rule_attempts.clear()
+        self.rule_successes.clear()
+
+    def reset_stats(self):
+        """
+        Reset the instrumentation timings and counters, and the resolutions
+        cache counters. The cache itself is kept
+        """
+        self.timings = defaultdict(float)
+        self.counters = Counter()
+        self.rule_counters = defaultdict(Counter)
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def stats(self):
+        """
+        Instrumentation statistics, only recorded if `instrument` is set,
+        except for the resolutions cache ones
+        :return: Dictionary with the following keys::
+                 - docs, tokens: Number of docs and tokens processed
+                 - candidates: Number of tokens matching some affix
+                 - lexicon_lookups: Number of lexicon lookups
+                 - timings: Seconds spent by phase (`match`, `resolve`,
+                            `retokenize` and `lemmas`)
+                 - rules: Counters by rule key of tokens `matched`, not
+                          resolved to an analysis (`unresolved`) and with
+                          an analysis `applied`
+                 - cache: Resolutions cache `size`, `hits`, `misses` and
+                          `hit_rate`
+        """
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "docs": self.counters["docs"],
+            "tokens": self.counters["tokens"],
+            "candidates": self.counters["candidates"],
+            "lexicon_lookups": self.counters["lexicon_lookups"],
+            "timings": dict(self.timings),
+            "rules": {
+                rule_key: dict(counter)
+                for rule_key, counter in self.rule_counters.items()
+            },
+            "cache": {
+                "size": len(self.cache),
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "hit_rate": self.cache_hits / lookups if lookups else 0.0,
+            },
+        }
+
+    def clock(self, phase=None, start=None):
+        """
+        Instrumentation clock, a no-op unless `instrument` is set
+        :param phase: Phase to add the time elapsed since `start` to
+        :param start: Value previously returned by `clock`
+        :return: Current time
+        """
+        if not self.instrument:
+            return None
+        now = perf_counter()
+        if phase is not None:
+            self.timings[phase] += now - start
+        return now
+
+    def apply_resolution(self, retokenizer, token, resolution):
+        # Strings were added to the vocab when resolving, so the attributes
+        # are assigned their hashes without hashing the strings again
+        if resolution.lemma_id is not None:
+            token.lemma = resolution.lemma_id
+        if resolution.pieces:
+            retokenizer.split(token, resolution.pieces, [
+                (token, head) for head in resolution.heads
+            ])
+        token.pos = resolution.pos_id
+        if resolution.tags_id is not None:
+            token.tag = resolution.tags_id
+        token._.affixes_rule = resolution.rule_key
+        token._.affixes_text = resolution.text
+        token._.affixes_kind = resolution.kind
+        token._.affixes_length = resolution.length
+        token._.affixes_lemma = token.lemma_
+        token._.has_affixes = True
+
+    def apply_rules(self, retokenizer, token, rule):
+        resolution = self.resolve_rule(token, AffixRule.compile(rule),
+                                       token._.affixes_rule)
+        if resolution is not None and not token._.has_affixes:
+            self.apply_resolution(retokenizer, token, resolution)
+
+    def match(self, doc):
+        """
+        Find the tokens of a doc with affixes. Candidates are selected on
+        the doc attributes array, and only the tokens with affixes are
+        materialised
+        :param doc: SpaCy Doc
+        :return: List of tuples with the matched tokens, with
+                 `affixes_rule` set to the longest affix rule key, and
+                 their candidate rule keys as returned by `schedule`
+        """
+        start = self.clock()
         tokens = []
-        for match_id, start, end in matches:
-            match_key = self.nlp.vocab.strings[match_id]
-            for token in doc[start:end]:
-                token._.affixes_rule = match_key
-                tokens.append(token)
+        min_length = self.matcher.min_length
+        regex_min_length = self.matcher.regex_min_length
+        if len(doc) and (min_length, regex_min_length) != (None, None):
+            array = doc.to_array(MATCH_ATTRS)
+            literal = numpy.zeros(len(doc), dtype=bool)
+            if min_length is not None:
+                literal = array[:, 1] >= min_length
+                if self.matcher.alphabetic:
+                    # Numbers, URLs and punctuation cannot match the affixes
+                    literal &= (array[:, 2] != 0) & (array[:, 3] == 0)
+            mask = literal
+            if regex_min_length is not None:
+                # Only the regex rules are tested on the rest of tokens
+                mask = literal | (array[:, 1] >= regex_min_length)
+            positions = numpy.flatnonzero(mask)
+            # Affixes are matched once per distinct lowercase text, whose
+            # length and kind are the same for all its tokens
+            lowers, first, inverse = numpy.unique(
+                array[positions, 0], return_index=True, return_inverse=True)
+            strings = doc.vocab.strings
+            matches = [
+                self.schedule(self.matcher.candidates(strings[lower],
+                                                      literal=is_literal))
+                for lower, is_literal in zip(
+                    lowers.tolist(), literal[positions[first]].tolist())
+            ]
+            for position, index in zip(positions.tolist(), inverse.tolist()):
+                rule_keys = matches[index]
+                if rule_keys:
+                    token = doc[position]
+                    token._.affixes_rule = rule_keys[0]
+                    tokens.append((token, rule_keys))
+        if self.instrument:
+            self.counters["docs"] += 1
+            self.counters["tokens"] += len(doc)
+            self.counters["candidates"] += len(tokens)
+            self.clock("match", start)
+        return tokens
+
+    def resolve(self, tokens, resolutions=None):
+        """
+        Resolve the analyses of matched tokens, once per distinct text and
+        candidate rule keys
+        :param tokens: Iterable of tuples as returned by `match`
+        :param resolutions: Dictionary of already resolved analyses
+        :return: Dictionary keyed by `(token.text, rule_keys)` with the
+                 analyses as returned by `resolve_candidates`
+        """
+        start = self.clock()
+        resolutions = {} if resolutions is None else resolutions
+        for token, rule_keys in tokens:
+            key = (token.text, rule_keys)
+            if key not in resolutions:
+                resolutions[key] = self.resolve_cached(token, rule_keys)
+            if self.instrument:
+                resolution = resolutions[key]
+                for rule_key in rule_keys:
+                    counter = self.rule_counters[rule_key]
+                    counter["matched"] += 1
+                    if resolution is None or resolution.rule_key != rule_key:
+                        counter["unresolved"] += 1
+        self.clock("resolve", start)
+        return resolutions
+
+    def retokenize(self, doc, tokens, resolutions):
+        """
+        Apply the resolved analyses to the matched tokens of a doc
+        :param doc: SpaCy Doc
+        :param tokens: List of tuples of tokens of `doc` and their rule keys
+                       as returned by `match`
+        :param resolutions: Dictionary as returned by `resolve`
+        :return: The processed doc
+        """
+        start = self.clock()
+        # Indices and lemmas of the modified tokens once splits are applied
+        indices = []
+        offset = 0
         with doc.retokenize() as retokenizer:
-            for token in tokens:
-                if token._.affixes_rule:
-                    for rule in self.rules[token._.affixes_rule]:
-                        self.apply_rules(retokenizer, token, rule)
+            for token, rule_keys in tokens:
+                resolution = resolutions.get((token.text, rule_keys))
+                if resolution is not None and not token._.has_affixes:
+                    self.apply_resolution(retokenizer, token, resolution)
+                    indices.append((token.i + offset, token.lemma))
+                    offset += max(len(resolution.pieces) - 1, 0)
+                    if self.instrument:
+                        self.rule_counters[resolution.rule_key][
+                            "applied"] += 1
                 if not token._.has_affixes:
                     token._.affixes_rule = None
+        start = self.clock("retokenize", start)
         if self.replace_lemmas:
-            # Tokens are views of C structs
-            for index, _ in enumerate(doc):
-                if doc[index]._.has_affixes and doc[index]._.affixes_lemma:
-                    doc[index].lemma_ = doc[index]._.affixes_lemma
+            # Tokens are views of C structs, the split resets their lemmas
+            for index, lemma_id in indices:
+                token = doc[index]
+                if token._.has_affixes and token._.affixes_lemma:
+                    token.lemma = lemma_id
+            self.clock("lemmas", start)
         return doc
+
+    def __call__(self, doc):
+        tokens = self.match(doc)
+        return self.retokenize(doc, tokens, self.resolve(tokens))
+
+    def pipe(self, docs, batch_size=128):
+        """
+        Process a stream of docs in batches, resolving each distinct token
+        text and rule key only once per batch
+        :param docs: Iterable of SpaCy Doc
+        :param batch_size: Number of docs per batch
+        :return: Generator of processed docs
+        """
+        for batch in minibatch(docs, size=batch_size):
+            batch_tokens = [self.match(doc) for doc in batch]
+            resolutions = self.resolve(chain.from_iterable(batch_tokens))
+            for doc, tokens in zip(batch, batch_tokens):
+                yield self.retokenize(doc, tokens, resolutions)
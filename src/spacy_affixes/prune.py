@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Affixes rules pruning driven by the analyses found in a sample corpus."""
+import sys
+
+import spacy
+
+from .annotate import read_records
+from .main import AffixesMatcher
+from .utils import dump_affixes
+from .utils import load_affixes
+
+
+def profile_rules(nlp, texts, rules=None, lexicon=None, batch_size=128):
+    """
+    Run a sample corpus through `AffixesMatcher` and count the analyses
+    produced by each rule key
+    :param nlp: SpaCy NLP object. Only its tokenizer is used
+    :param texts: Iterable of texts
+    :param rules: Dictionary of rules for affixes handling. Defaults to the
+                  ones returned by `load_affixes`
+    :param lexicon: Lexicon mapping. Defaults to the one returned by
+                    `load_lexicon`
+    :param batch_size: Number of docs per batch
+    :return: Dictionary with the number of analyses keyed by rule key,
+             including the rule keys that never produced one
+    """
+    affixes_matcher = AffixesMatcher(
+        nlp, rules=rules, lexicon=lexicon, replace_lemmas=False,
+        instrument=True
+    )
+    docs = (nlp.make_doc(text) for text in texts)
+    for _ in affixes_matcher.pipe(docs, batch_size=batch_size):
+        pass
+    counters = affixes_matcher.stats()["rules"]
+    analyses = {}
+    for rule_key in affixes_matcher.rules:
+        counter = counters.get(rule_key, {})
+        analyses[rule_key] = (counter.get("matched", 0)
+                              - counter.get("unresolved", 0))
+    return analyses
+
+
+def prune_rules(rules, analyses, min_count=1):
+    """
+    Keep only the rules whose keys produced enough analyses. Tokens that
+    only matched a pruned rule key are left untouched, and tokens that
+    matched a pruned key along with a shorter one are analysed by the
+    shorter one
+    :param rules: Dictionary of rules for affixes handling
+    :param analyses: Dictionary as returned by `profile_rules`
+    :param min_count: Minimum number of analyses to keep a rule key
+    :return: Dictionary of rules with the same form as `rules`
+    """
+    return {
+        rule_key: rule_list for rule_key, rule_list in rules.items()
+        if analyses.get(rule_key, 0) >= min_count
+    }
+
+
+def prune(input_path, output_path, model="es", input_format=None,
+          min_count=1, batch_size=128):
+    """
+    Write the affixes rules that produce analyses in a sample corpus as
+    JSON, to be loaded and passed as `AffixesMatcher(nlp, rules=...)`
+    :param input_path: Path to the sample corpus, one doc per line. `-`
+                       for stdin
+    :param output_path: Path to the JSON file with the pruned rules
+    :param model: SpaCy model whose tokenizer is used
+    :param input_format: `"jsonl"` or `"text"`. Defaults to `"jsonl"` for
+                         files ending in `.jsonl` and plain text otherwise
+    :param min_count: Minimum number of analyses to keep a rule key
+    :param batch_size: Number of docs per batch
+    :return: Dictionary as returned by `profile_rules`
+    """
+    if input_format is None:
+        is_jsonl = input_path.endswith(".jsonl")
+        input_format = "jsonl" if is_jsonl else "text"
+    nlp = spacy.load(model, disable=["tagger", "parser", "ner"])
+    rules = load_affixes()
+    if input_path == "-":
+        input_file = sys.stdin
+    else:
+        input_file = open(input_path, "r", encoding="utf-8")
+    try:
+        texts = (record["text"]
+                 for record in read_records(input_file, input_format))
+        analyses = profile_rules(nlp, texts, rules, batch_size=batch_size)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+    dump_affixes(prune_rules(rules, analyses, min_count), output_path)
+    return analyses
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Compiled affixes rules."""
+import re
+
+AFFIXES_SUFFIX = "suffix"
+AFFIXES_PREFIX = "prefix"
+# Fields of the rules as serialized in JSON
+RULE_FIELDS = (
+    "pattern", "kind", "pos_re", "assign_pos", "strip_accent",
+    "assign_lemma", "always_apply", "affix_add", "affix_text",
+)
+# Patterns made of anything but these characters are plain literals
+LITERAL_RE = re.compile(r"[^\\.^$|?*+()\[\]{}]*")
+# Literal EAGLES category prefix of a POS regular expression and the rest
+POS_CATEGORY_RE = re.compile(r"\^?([A-Za-z0-9]*)(.*)", re.S)
+
+
+def affix_literal(rule):
+    """
+    Extract the literal affix text of a rule
+    :param rule: Rule dictionary as returned by `load_affixes`
+    :return: Lowercased affix if the rule pattern is a plain anchored
+             literal, `None` otherwise
+    """
+    pattern = rule["pattern"]
+    if rule["kind"] == AFFIXES_PREFIX and pattern.startswith("^"):
+        affix = pattern[1:]
+    elif rule["kind"] != AFFIXES_PREFIX and pattern.endswith("$"):
+        affix = pattern[:-1]
+    else:
+        return None
+    if affix and LITERAL_RE.fullmatch(affix):
+        return affix.lower()
+    return None
+
+
+def pos_category(pos_re):
+    """
+    Reduce an EAGLES regular expression to the literal category prefix every
+    matching tag must start with
+    :param pos_re: EAGLE regular expression, (ex. `r"^V"`)
+    :return: Tuple with the uppercased prefix (`None` if there is none) and
+             whether matching the prefix is enough, so the regular
+             expression does not need to be evaluated
+    """
+    literal, rest = POS_CATEGORY_RE.fullmatch(pos_re).groups()
+    if rest[:1] in ("?", "*", "{"):
+        # The last literal character is optional
+        literal, rest = literal[:-1], literal[-1:] + rest
+    if not literal or "|" in rest:
+        return None, False
+    return literal.upper(), rest in ("", ".*")
+
+
+class AffixRule(object):
+    __slots__ = ("compiled_regex", "compiled_pos_regex") + RULE_FIELDS + (
+        "pos_category", "pos_exact", "affix", "affix_length",
+        "lemma_template", "affix_text_joined",
+    )
+
+    def __init__(self, pattern, kind, pos_re, assign_pos, strip_accent,
+                 assign_lemma, always_apply, affix_add, affix_text):
+        """
+        Affix rule with its lemma template split and its regular
+        expressions compiled on first use, since most rules never match.
+        Rules can still be read as dictionaries with the same keys used in
+        the serialized JSON form, and `dict(rule)` returns that form
+        :param pattern: Regular expression to match, (ex. `r"ito$"`)
+        :param kind: `AFFIXES_SUFFIX` or `AFFIXES_PREFIX`
+        :param pos_re: EAGLE regular expression to match, (ex. `r"V"`)
+        :param assign_pos: EAGLE tag to assign, if any
+        :param strip_accent: Whether to strip accents from the rest of the
+                             token
+        :param assign_lemma: Lemma template, (ex. `"R+A"`)
+        :param always_apply: Whether to apply the rule to known words
+        :param affix_add: List of strings to add to the rest of the token
+        :param affix_text: List of strings with the text of the affixes
+        """
+        self.pattern = pattern
+        self.kind = kind
+        self.pos_re = pos_re
+        self.assign_pos = assign_pos
+        self.strip_accent = strip_accent
+        self.assign_lemma = assign_lemma
+        self.always_apply = always_apply
+        self.affix_add = affix_add
+        self.affix_text = affix_text
+        self.compiled_regex = None
+        self.compiled_pos_regex = None
+        self.pos_category, self.pos_exact = pos_category(pos_re)
+        self.affix = affix_literal(self)
+        self.affix_length = None if self.affix is None else len(self.affix)
+        self.lemma_template = tuple(assign_lemma.split("+"))
+        self.affix_text_joined = "".join(affix_text)
+
+    @property
+    def regex(self):
+        if self.compiled_regex is None:
+            self.compiled_regex = re.compile(self.pattern)
+        return self.compiled_regex
+
+    @property
+    def pos_regex(self):
+        if self.compiled_pos_regex is None:
+            self.compiled_pos_regex = re.compile(self.pos_re, re.I)
+        return self.compiled_pos_regex
+
+    @classmethod
+    def compile(cls, rule):
+        """
+        Build an `AffixRule` from a rule dictionary
+        :param rule: Rule dictionary or `AffixRule`
+        :return: `AffixRule`
+        """
+        if isinstance(rule, cls):
+            return rule
+        return cls(**{field: rule[field] for field in RULE_FIELDS})
+
+    def keys(self):
+        return RULE_FIELDS
+
+    def __getitem__(self, field):
+        if field not in RULE_FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __getstate__(self):
+        # Compiled regular expressions are left out, and compiled again on
+        # first use after unpickling
+        return tuple(getattr(self, slot) for slot in self.__slots__[2:])
+
+    def __setstate__(self, state):
+        self.compiled_regex = None
+        self.compiled_pos_regex = None
+        for slot, value in zip(self.__slots__[2:], state):
+            setattr(self, slot, value)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({dict(self)!r})"
+
+
+def compile_affixes(affixes):
+    """
+    Compile all the rules of an affixes dictionary
+    :param affixes: Dictionary of lists of rules keyed by rule key
+    :return: Dictionary of lists of `AffixRule` keyed by rule key
+    """
+    return {
+        rule_key: [AffixRule.compile(rule) for rule in rules]
+        for rule_key, rules in affixes.items()
+    }
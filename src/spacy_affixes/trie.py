@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""Affix matching engine based on character tries."""
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+from .rules import AFFIXES_PREFIX
+from .rules import affix_literal
+
+# Key used in the trie nodes to store the rule keys ending at that node
+TERMINAL = None
+
+
+class AffixesTrie(object):
+
+    def __init__(self, rules):
+        """
+        Compile all the affixes rules into a forward trie for prefixes and
+        a reversed trie for suffixes, so all the candidate rule keys for a
+        token are found in a single pass over its characters. Rules whose
+        patterns are not plain literals are kept as compiled regular
+        expressions and tested separately. Tokens too short to leave a stem
+        or whose first and last characters start no affix are rejected
+        before walking the tries, and tokens too short for any regular
+        expression before testing them.
+        :param rules: Dictionary of rules for affixes handling as returned
+                      by `load_affixes`
+        """
+        self.prefixes = {}
+        self.suffixes = {}
+        self.regexes = []
+        # Minimum token lengths for the literal and the regex rules
+        self.min_length = None
+        self.regex_min_length = None
+        # Whether every literal affix is alphabetic, so only alphabetic
+        # tokens match them
+        self.alphabetic = True
+        for rule_key, rule_list in rules.items():
+            for rule in rule_list:
+                # Rules adding nothing to the rest of the token need a stem
+                stem_length = 0 if any(rule["affix_add"]) else 1
+                affix = affix_literal(rule)
+                if affix is None:
+                    regex = re.compile(fr"(?i){rule['pattern']}")
+                    if (regex, rule_key) not in self.regexes:
+                        self.regexes.append((regex, rule_key))
+                    length = max(1, self.regex_width(regex) + stem_length)
+                    if (self.regex_min_length is None
+                            or length < self.regex_min_length):
+                        self.regex_min_length = length
+                    continue
+                if rule["kind"] == AFFIXES_PREFIX:
+                    self.add(self.prefixes, affix, rule_key)
+                else:
+                    self.add(self.suffixes, affix[::-1], rule_key)
+                length = len(affix) + stem_length
+                if self.min_length is None or length < self.min_length:
+                    self.min_length = length
+                self.alphabetic = self.alphabetic and affix.isalpha()
+
+    @staticmethod
+    def regex_width(regex):
+        """
+        Minimum length of the texts matched by a compiled regular expression
+        """
+        try:
+            return sre_parse.parse(regex.pattern, regex.flags).getwidth()[0]
+        except (re.error, AttributeError):
+            return 0
+
+    @staticmethod
+    def add(trie, affix, rule_key):
+        node = trie
+        for char in affix:
+            node = node.setdefault(char, {})
+        rule_keys = node.setdefault(TERMINAL, [])
+        if rule_key not in rule_keys:
+            rule_keys.append(rule_key)
+
+    @staticmethod
+    def walk(trie, chars):
+        """
+        Walk a trie along a sequence of characters
+        :param trie: Trie to traverse
+        :param chars: Iterable of characters
+        :return: List of tuples `(affix length, rule key)` for every rule
+                 found along the path
+        """
+        found = []
+        node = trie
+        for length, char in enumerate(chars, start=1):
+            node = node.get(char)
+            if node is None:
+                break
+            for rule_key in node.get(TERMINAL, ()):
+                found.append((length, rule_key))
+        return found
+
+    def literal_candidates(self, text):
+        """
+        Find the literal affixes rules matching a text (case insensitive)
+        :param text: Text of the token
+        :return: List of tuples `(affix length, rule key)`, suffixes first
+        """
+        if self.min_length is None or len(text) < self.min_length:
+            return []
+        if (text[-1].lower() not in self.suffixes
+                and text[0].lower() not in self.prefixes):
+            return []
+        lower = text.lower()
+        found = self.walk(self.suffixes, reversed(lower))
+        found += self.walk(self.prefixes, lower)
+        return found
+
+    def regex_candidates(self, text):
+        """
+        Find the regular expression rules matching a text
+        :param text: Text of the token
+        :return: List of tuples `(match length, rule key)`
+        """
+        if self.regex_min_length is None or len(text) < self.regex_min_length:
+            return []
+        found = []
+        for regex, rule_key in self.regexes:
+            match = regex.search(text)
+            if match:
+                found.append((match.end() - match.start(), rule_key))
+        return found
+
+    def candidates(self, text, literal=True):
+        """
+        Find the rule keys whose affixes match a text (case insensitive)
+        :param text: Text of the token
+        :param literal: Whether to look for literal affixes, or only for
+                        the regular expression rules
+        :return: List of tuples `(affix length, rule key)`, longest affixes
+                 first and suffixes before prefixes of the same length
+        """
+        found = self.literal_candidates(text) if literal else []
+        found += self.regex_candidates(text)
+        found.sort(key=lambda length_key: -length_key[0])
+        candidates = []
+        rule_keys = set()
+        for length, rule_key in found:
+            if rule_key not in rule_keys:
+                rule_keys.add(rule_key)
+                candidates.append((length, rule_key))
+        return candidates
+
+    def __call__(self, text):
+        """
+        Find the rule keys whose affixes match a text (case insensitive)
+        :param text: Text of the token
+        :return: List of matching rule keys, longest affixes first
+        """
+        return [rule_key for _, rule_key in self.candidates(text)]
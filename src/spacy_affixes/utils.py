@@ -1,47 +1,240 @@
+import hashlib
+import glob
 import json
 import os
+import pickle
 import re
 import sys
 import unicodedata
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from functools import partial
+from itertools import chain
+from pathlib import Path
 from urllib.request import urlopen
+from . import __version__
+from .bloom import BloomFilter
+from .eagles import EAGLES_TABLE
+from .eagles import eagles2pos_tags
 from .eagles import eagles2ud
-
-AFFIXES_SUFFIX = "suffix"
-AFFIXES_PREFIX = "prefix"
+from .lexicon import FoldedLexicon
+from .lexicon import LazyLexicon
+from .lexicon import attach_lexicon
+from .lexicon import file_checksum
+from .lexicon import lexicon_eagles
+from .lexicon import lookup_category
+from .lexicon import write_binary_entries
+from .lexicon import write_binary_lexicon
+from .rules import AFFIXES_PREFIX
+from .rules import AFFIXES_SUFFIX
+from .rules import compile_affixes
+from .trie import AffixesTrie
 BASE_DIR = os.path.dirname(os.path.realpath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 FREELING_DIR = os.environ.get("FREELINGDIR") or os.environ.get("FREELINGSHARE")
+# Base URL (or local directory) of a Freeling repository or mirror
+FREELING_URL = (os.environ.get("FREELINGURL")
+                or "https://raw.githubusercontent.com/TALP-UPC/FreeLing")
+AFFIXES_SOURCE = "afixos.dat"
+LEXICON_SOURCE = "dictionary/entries/MM.{category}"
+# Categories and Universal Dependency (UD) equivalent. None to auto-detect
+LEXICON_CATEGORIES = (
+    ("adj", "ADJ"),
+    ("adv", "ADV"),
+    ("int", "INTJ"),
+    ("nom", "NOUN"),
+    ("vaux", "AUX"),
+    ("verb", "VERB"),
+    ("tanc", None),
+)
+CHECKSUMS_FILENAME = "SHA256SUMS"
+# Checksum of the sources the affixes and lexicon files were built from
+BUILD_FILENAME = "BUILD"
+# Compiled affixes rules loaded with `shared=True` keyed by (lang, version)
+SHARED_AFFIXES = {}
+# Version of the pickled bundles layout, part of their content hash
+BUNDLE_FORMAT = 2
+# Bundles loaded with `shared=True` keyed by (lang, version)
+SHARED_BUNDLES = {}
+# Stems are repeated across tokens and `affix_add` alternatives
+STRIP_ACCENTS_CACHE_SIZE = 65536
+# ASCII strings have no accents (`str.isascii` needs Python 3.7)
+NON_ASCII = re.compile(r"[^\x00-\x7f]")
 
 
-def download(lang, version=None):
+def download(lang, version=None, base_url=None, force=False,
+             checksums=None):
+    """
+    Download the Freeling affixes rules and dictionary and build the files
+    loaded by `load_affixes` and `load_lexicon`. Nothing is rebuilt if they
+    were already built from the same sources
+    :param lang: Two characters code for a language
+    :param version: Freeling version. Defaults to `"4.1"`
+    :param base_url: Base URL of the Freeling repository, or of a mirror of
+                     it, or path to a local copy. Defaults to `FREELING_URL`
+    :param force: Boolean specifying whether to download and build even if
+                  cached sources and built files exist
+    :param checksums: Dictionary of expected SHA-256 hex digests keyed by
+                      source file name, (ex. `{"MM.adj": "..."}`)
+    """
     version = version if version is not None else "4.1"
-    affixes = download_affixes(lang, version)
-    write_affixes(lang, version, affixes)
-    lexicon = download_lexicon(lang, version)
-    write_lexicon(lang, version, lexicon)
+    sources_dir = fetch_sources(lang, version, base_url, force, checksums)
+    with open(os.path.join(sources_dir, CHECKSUMS_FILENAME), "rb") as sums:
+        sources_checksum = hashlib.sha256(sums.read()).hexdigest()
+    build_path = os.path.join(sources_dir, BUILD_FILENAME)
+    built = [
+        os.path.join(DATA_DIR, f"affixes-{lang}-{version}.json"),
+        os.path.join(DATA_DIR, f"lexicon-{lang}-{version}.bin"),
+        build_path,
+    ]
+    if not force and all(os.path.isfile(path) for path in built):
+        with open(build_path, "r") as build:
+            if build.read().strip() == sources_checksum:
+                sys.stdout.write(f"Affixes and lexicon {lang}-{version} "
+                                 f"are up to date\n")
+                return
+    affixes_path = os.path.join(sources_dir, AFFIXES_SOURCE)
+    with open(affixes_path, "r", encoding="utf-8") as affixes_raw:
+        write_affixes(lang, version, build_affixes(affixes_raw.read()))
+    write_lexicon_entries(lang, version, source_lexicon_entries(sources_dir))
+    load_bundle(lang, version)
+    with open(build_path, "w") as build:
+        build.write(f"{sources_checksum}\n")
+
+
+def source_url(base_url, version, lang, source):
+    if "://" not in base_url:
+        base_url = Path(base_url).resolve().as_uri()
+    return f"{base_url.rstrip('/')}/{version}/data/{lang}/{source}"
+
+
+def read_checksums(path):
+    if not os.path.isfile(path):
+        return {}
+    checksums = {}
+    with open(path, "r") as sums:
+        for line in sums:
+            if line.strip():
+                checksum, filename = line.split()
+                checksums[filename] = checksum
+    return checksums
+
+
+def fetch_source(url, path, checksum=None):
+    """
+    Download a file in chunks, verifying its checksum
+    :param url: URL to download
+    :param path: Path of the file to write
+    :param checksum: Expected SHA-256 hex digest, if any
+    :return: SHA-256 hex digest of the file
+    """
+    digest = hashlib.sha256()
+    temp_path = f"{path}.tmp"
+    with urlopen(url) as response, open(temp_path, "wb") as output:
+        for chunk in iter(partial(response.read, 1 << 16), b""):
+            digest.update(chunk)
+            output.write(chunk)
+    if checksum is not None and digest.hexdigest() != checksum:
+        os.remove(temp_path)
+        raise ValueError(f"Checksum mismatch for {url}: expected "
+                         f"{checksum}, got {digest.hexdigest()}")
+    os.replace(temp_path, path)
+    return digest.hexdigest()
+
+
+def fetch_sources(lang, version, base_url=None, force=False,
+                  checksums=None):
+    """
+    Download the Freeling sources concurrently into a local cache. Cached
+    files whose checksums are still the recorded (and expected) ones are
+    not downloaded again
+    :param lang: Two characters code for a language
+    :param version: Freeling version
+    :param base_url: Base URL of the Freeling repository, or of a mirror of
+                     it, or path to a local copy. Defaults to `FREELING_URL`
+    :param force: Boolean specifying whether to download cached files
+    :param checksums: Dictionary of expected SHA-256 hex digests keyed by
+                      source file name
+    :return: Path to the cache directory, with the sources and their
+             checksums in a `SHA256SUMS` file
+    """
+    base_url = FREELING_URL if base_url is None else base_url
+    checksums = checksums or {}
+    sources_dir = os.path.join(DATA_DIR, "freeling", version, lang)
+    os.makedirs(sources_dir, exist_ok=True)
+    checksums_path = os.path.join(sources_dir, CHECKSUMS_FILENAME)
+    cached = {} if force else read_checksums(checksums_path)
+    sources = [AFFIXES_SOURCE] + [
+        LEXICON_SOURCE.format(category=category)
+        for category, _ in LEXICON_CATEGORIES
+    ]
+
+    def fetch(source):
+        filename = os.path.basename(source)
+        path = os.path.join(sources_dir, filename)
+        checksum = cached.get(filename)
+        if (checksum is not None and os.path.isfile(path)
+                and checksums.get(filename, checksum) == checksum
+                and file_checksum(path) == checksum):
+            return filename, checksum
+        sys.stdout.write(f"Downloading {lang}-{version} {source}...\n")
+        url = source_url(base_url, version, lang, source)
+        return filename, fetch_source(url, path, checksums.get(filename))
+
+    with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+        fetched = sorted(executor.map(fetch, sources))
+    with open(checksums_path, "w") as sums:
+        sums.writelines(f"{checksum}  {filename}\n"
+                        for filename, checksum in fetched)
+    return sources_dir
 
 
 def write_affixes(lang, version, affixes):
     affixes_filename = f"affixes-{lang}-{version}.json"
-    with open(os.path.join(DATA_DIR, affixes_filename), "w") as dump:
-        json.dump(affixes, dump)
+    dump_affixes(affixes, os.path.join(DATA_DIR, affixes_filename))
+
+
+def dump_affixes(affixes, path):
+    """
+    Write affixes rules as JSON, in the form `load_affixes` reads
+    :param affixes: Dictionary of lists of rules keyed by rule key
+    :param path: Path of the JSON file
+    """
+    with open(path, "w") as dump:
+        json.dump({
+            rule_key: [dict(rule) for rule in rules]
+            for rule_key, rules in affixes.items()
+        }, dump)
 
 
 def write_lexicon(lang, version, lexicon):
-    lexicon_filename = f"lexicon-{lang}-{version}.json"
-    with open(os.path.join(DATA_DIR, lexicon_filename), "w") as dump:
-        json.dump(lexicon, dump)
+    lexicon_filename = f"lexicon-{lang}-{version}.bin"
+    write_binary_lexicon(os.path.join(DATA_DIR, lexicon_filename), lexicon)
+
 
+def write_lexicon_entries(lang, version, entries):
+    """
+    Same as `write_lexicon` but from a stream of entries, as returned by
+    `lexicon_entries`, with bounded memory use
+    """
+    lexicon_filename = f"lexicon-{lang}-{version}.bin"
+    write_binary_entries(os.path.join(DATA_DIR, lexicon_filename), entries)
 
-def load_affixes(lang="es", version="4.1"):
+
+def load_affixes(lang="es", version="4.1", shared=False):
+    if shared:
+        # Load once per process, forked processes inherit the rules
+        if (lang, version) not in SHARED_AFFIXES:
+            SHARED_AFFIXES[(lang, version)] = load_affixes(lang, version)
+        return SHARED_AFFIXES[(lang, version)]
     affixes_filename = f"affixes-{lang}-{version}.json"
     affixes_path = os.path.join(DATA_DIR, affixes_filename)
     if not os.path.isfile(affixes_path):
         if FREELING_DIR:
             affixes_raw_path = os.path.join(FREELING_DIR, lang, "affixos.dat")
             with open(affixes_raw_path, "r") as affixes_raw:
-                affixes = build_affixes(affixes_raw)
+                affixes = build_affixes(affixes_raw.read())
                 write_affixes(lang, version, affixes)
                 return affixes
         else:
@@ -56,19 +249,105 @@ def load_affixes(lang="es", version="4.1"):
             """)
     else:
         with open(affixes_path, "r") as dump:
-            return json.load(dump)
+            return compile_affixes(json.load(dump))
+
+
+def load_bundle(lang="es", version="4.1", shared=False):
+    """
+    Load the precompiled bundle of the affixes rules of a language and
+    version: the compiled rules, the affixes trie built from them and the
+    EAGLES conversions of the tags they assign and of the tags of the
+    lexicon. Bundles are pickled under `DATA_DIR` keyed by a hash of the
+    rules file and the lexicon file size and time, and built again whenever
+    they change
+    :param lang: Two characters code for a language
+    :param version: Freeling version
+    :param shared: Boolean specifying whether to load the bundle once per
+                   process, so forked processes inherit it
+    :return: Dictionary with `rules`, `trie` and `eagles` keys
+    """
+    if shared:
+        if (lang, version) not in SHARED_BUNDLES:
+            SHARED_BUNDLES[(lang, version)] = load_bundle(lang, version)
+        return SHARED_BUNDLES[(lang, version)]
+    affixes_path = os.path.join(DATA_DIR, f"affixes-{lang}-{version}.json")
+    if not os.path.isfile(affixes_path):
+        # Writes the rules file or raises if the data is missing
+        load_affixes(lang, version)
+    digest = hashlib.sha256(f"{BUNDLE_FORMAT}:{__version__}:".encode())
+    with open(affixes_path, "rb") as affixes_file:
+        digest.update(affixes_file.read())
+    # The EAGLES table also covers the tags of the lexicon, if built
+    lexicon_path = os.path.join(DATA_DIR, f"lexicon-{lang}-{version}.bin")
+    if os.path.isfile(lexicon_path):
+        lexicon_stat = os.stat(lexicon_path)
+        digest.update(
+            f":{lexicon_stat.st_size}:{lexicon_stat.st_mtime_ns}".encode())
+    bundle_prefix = os.path.join(DATA_DIR, f"bundle-{lang}-{version}-")
+    bundle_path = f"{bundle_prefix}{digest.hexdigest()[:16]}.pickle"
+    bundle = None
+    if os.path.isfile(bundle_path):
+        try:
+            with open(bundle_path, "rb") as bundle_file:
+                bundle = pickle.load(bundle_file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            bundle = None
+    if bundle is None:
+        rules = load_affixes(lang, version)
+        eagles = {rule.assign_pos
+                  for rule_list in rules.values() for rule in rule_list
+                  if rule.assign_pos}
+        if os.path.isfile(lexicon_path):
+            eagles.update(lexicon_eagles(attach_lexicon(lexicon_path)))
+        bundle = {
+            "rules": rules,
+            "trie": AffixesTrie(rules),
+            "eagles": {eagle: eagles2pos_tags(eagle) for eagle in eagles},
+        }
+        for stale_path in glob.glob(f"{glob.escape(bundle_prefix)}*"):
+            try:
+                os.remove(stale_path)
+            except OSError:
+                # Read-only or already removed by another process
+                pass
+        try:
+            with open(f"{bundle_path}.tmp", "wb") as bundle_file:
+                pickle.dump(bundle, bundle_file, pickle.HIGHEST_PROTOCOL)
+            os.replace(f"{bundle_path}.tmp", bundle_path)
+        except OSError:
+            # Read-only data directories just miss the bundle speed up
+            pass
+    EAGLES_TABLE.update(bundle["eagles"])
+    return bundle
 
 
-def load_lexicon(lang="es", version="4.1"):
-    lexicon_filename = f"lexicon-{lang}-{version}.json"
+def load_lexicon(lang="es", version="4.1", lazy=False, folded=False):
+    if folded:
+        # Index accent-folded forms to find the words of stripped stems
+        return FoldedLexicon(load_lexicon(lang, version, lazy),
+                             fold_accents)
+    lexicon_filename = f"lexicon-{lang}-{version}.bin"
     lexicon_path = os.path.join(DATA_DIR, lexicon_filename)
+    # Lexicons downloaded by previous versions were stored as JSON
+    lexicon_json_path = os.path.join(DATA_DIR,
+                                     f"lexicon-{lang}-{version}.json")
+    lexicon_available = (os.path.isfile(lexicon_path)
+                         or os.path.isfile(lexicon_json_path)
+                         or FREELING_DIR)
+    if lazy and lexicon_available:
+        # Defer reading (or building) the lexicon until the first lookup
+        return LazyLexicon(partial(load_lexicon, lang, version))
     if not os.path.isfile(lexicon_path):
-        if FREELING_DIR:
+        if os.path.isfile(lexicon_json_path):
+            with open(lexicon_json_path, "r") as dump:
+                write_lexicon(lang, version, json.load(dump))
+            return attach_lexicon(lexicon_path)
+        elif FREELING_DIR:
             lexicon_raw_path = os.path.join(FREELING_DIR, lang, "dicc.src")
             with open(lexicon_raw_path, "r") as lexicon_raw:
-                lexicon = build_lexicon(lexicon_raw)
-                write_lexicon(lang, version, lexicon)
-                return lexicon
+                write_lexicon_entries(lang, version,
+                                      lexicon_entries(lexicon_raw))
+                return attach_lexicon(lexicon_path)
         else:
             raise ValueError("""
             Data for lexicon data is missing. Check
@@ -80,16 +359,64 @@ def load_lexicon(lang="es", version="4.1"):
             compatibilities.
             """)
     else:
-        with open(lexicon_path, "r") as dump:
-            return json.load(dump)
+        return attach_lexicon(lexicon_path)
 
 
-def download_affixes(lang="es", version="4.1"):
-    sys.stdout.write(f"Downloading affixes {lang}-{version}...\n")
-    url = (f"https://raw.githubusercontent.com/TALP-UPC/FreeLing/"
-           f"{version}/data/{lang}/afixos.dat")
-    affixes_raw = urlopen(url).read().decode('utf-8')
-    return build_affixes(affixes_raw)
+def build_lexicon_filter(lexicon, error_rate=0.01, max_bytes=None):
+    """
+    Build a membership filter of the words of a lexicon and of their
+    accent-stripped forms
+    :param lexicon: Mapping keyed by word
+    :param error_rate: Target false positive rate
+    :param max_bytes: Maximum size in bytes of the filter
+    :return: `BloomFilter`
+    """
+    folded = sum(fold_accents(word) != word for word in lexicon)
+    bloom_filter = BloomFilter(len(lexicon) + folded, error_rate, max_bytes)
+    for word in lexicon:
+        bloom_filter.add(word)
+        stripped = fold_accents(word)
+        if stripped != word:
+            bloom_filter.add(stripped)
+    return bloom_filter
+
+
+def load_lexicon_filter(lang="es", version="4.1", error_rate=0.01,
+                        max_bytes=None):
+    """
+    Load the membership filter of the lexicon of a language and version,
+    stored next to it and built again if the lexicon is newer or the
+    filter was built for a different error rate or size
+    :param lang: Two characters code for a language
+    :param version: Freeling version
+    :param error_rate: Target false positive rate
+    :param max_bytes: Maximum size in bytes of the filter
+    :return: `BloomFilter`
+    """
+    lexicon_path = os.path.join(DATA_DIR, f"lexicon-{lang}-{version}.bin")
+    filter_path = os.path.join(DATA_DIR, f"lexicon-{lang}-{version}.bloom")
+    if (os.path.isfile(filter_path) and os.path.isfile(lexicon_path)
+            and os.stat(filter_path).st_mtime_ns
+            >= os.stat(lexicon_path).st_mtime_ns):
+        bloom_filter = BloomFilter.read(filter_path)
+        size = BloomFilter.size(bloom_filter.items, error_rate, max_bytes)
+        if size == (bloom_filter.bits, bloom_filter.hashes):
+            return bloom_filter
+    bloom_filter = build_lexicon_filter(load_lexicon(lang, version),
+                                        error_rate, max_bytes)
+    try:
+        bloom_filter.write(filter_path)
+    except OSError:
+        # Read-only data directories build the filter on every load
+        pass
+    return bloom_filter
+
+
+def download_affixes(lang="es", version="4.1", base_url=None):
+    sources_dir = fetch_sources(lang, version, base_url)
+    affixes_path = os.path.join(sources_dir, AFFIXES_SOURCE)
+    with open(affixes_path, "r", encoding="utf-8") as affixes_raw:
+        return build_affixes(affixes_raw.read())
 
 
 def build_affixes(affixes_raw):
@@ -127,15 +454,64 @@ def build_affixes(affixes_raw):
                     "affix_text": text,
                 }
                 affixes_dict[f"{affix_kind}_{key}"].append(rule)
-    return affixes_dict
+    return compile_affixes(affixes_dict)
 
 
-def strip_accents(string):
+def unicodedata_strip_accents(string):
     return ''.join(char for char in unicodedata.normalize('NFD', string)
                    if (unicodedata.category(char) != 'Mn'
                        or unicodedata.name(char) == 'COMBINING TILDE'))
 
 
+class AccentsTable(dict):
+
+    def __init__(self, codepoints=()):
+        """
+        `str.translate` table that strips accents as
+        `unicodedata_strip_accents` does, one character at a time.
+        Characters not in the table are folded and added on first use
+        :param codepoints: Code points to fold in advance
+        """
+        super().__init__()
+        for codepoint in codepoints:
+            self[codepoint]
+
+    def __missing__(self, codepoint):
+        # NFD decomposes every character on its own and, out of the
+        # combining marks, only tildes are kept, so folding characters
+        # one by one gives the same output as folding the whole string
+        folded = unicodedata_strip_accents(chr(codepoint)) or None
+        self[codepoint] = folded
+        return folded
+
+
+# Latin letters and combining diacritical marks
+ACCENTS_TABLE = AccentsTable(chain(range(0x80, 0x250), range(0x300, 0x370),
+                                   range(0x1E00, 0x1F00)))
+
+
+def fold_accents(string):
+    """
+    Remove the accents of a string, except for tildes (the one in `ñ` is
+    kept as a combining character)
+    :param string: String to strip the accents from
+    :return: String without accents
+    """
+    if NON_ASCII.search(string) is None:
+        return string
+    return string.translate(ACCENTS_TABLE)
+
+
+@lru_cache(maxsize=STRIP_ACCENTS_CACHE_SIZE)
+def strip_accents(string):
+    """
+    Memoized `fold_accents`, for stems repeated across tokens
+    :param string: String to strip the accents from
+    :return: String without accents
+    """
+    return fold_accents(string)
+
+
 def eagle2tag(eagle):
     """
     Transform an EAGLES tag into UD features
@@ -147,7 +523,7 @@ def eagle2tag(eagle):
 
 
 def eagle2pos(eagle):
-    pos = eagles2ud(eagle).split('__')[0]
+    pos, _ = eagles2pos_tags(eagle)
     return pos
 
 
@@ -167,47 +543,68 @@ def token_transform(string, add, strip_accent):
     return transform
 
 
-def download_lexicon(lang="es", version="4.1"):
-    sys.stdout.write(f"Downloading lexicon {lang}-{version}...\n")
-    url = (f"https://raw.githubusercontent.com/TALP-UPC/FreeLing/"
-           f"{version}/data/{lang}/dictionary/entries/MM.{{category}}")
-    # Categories and Universal Dependency (UD) equivalent. None to auto-detect
-    categories = (
-        ("adj", "ADJ"),
-        ("adv", "ADV"),
-        ("int", "INTJ"),
-        ("nom", "NOUN"),
-        ("vaux", "AUX"),
-        ("verb", "VERB"),
-        ("tanc", None),
-    )
+def download_lexicon(lang="es", version="4.1", base_url=None):
     lexicon = defaultdict(list)
-    for category, ud in categories:
-        download_url = url.format(category=category)
-        for line in urlopen(download_url).read().decode('utf-8').split("\n"):
-            if len(line.strip()) == 0:
-                continue
-            word, lemma, eagle = line.split()
-            lexicon[word].append({
-                'lemma': lemma,
-                'eagle': eagle,
-                'ud': ud or eagle2pos(eagle),
-                'tags': eagle2tag(eagle).split("__")[1],
-            })
+    for word, analysis in download_lexicon_entries(lang, version, base_url):
+        lexicon[word].append(analysis)
     return lexicon
 
 
+def download_lexicon_entries(lang="es", version="4.1", base_url=None):
+    """
+    Stream the entries of the Freeling dictionary, line by line
+    :param lang: Two characters code for a language
+    :param version: Freeling version
+    :param base_url: Base URL of the Freeling repository, or of a mirror of
+                     it, or path to a local copy. Defaults to `FREELING_URL`
+    :return: Generator of tuples `(word, analysis)`
+    """
+    yield from source_lexicon_entries(
+        fetch_sources(lang, version, base_url)
+    )
+
+
+def source_lexicon_entries(sources_dir):
+    for category, ud in LEXICON_CATEGORIES:
+        filename = os.path.basename(LEXICON_SOURCE.format(category=category))
+        with open(os.path.join(sources_dir, filename), "rb") as lexicon_raw:
+            yield from lexicon_entries(lexicon_raw, ud)
+
+
 def build_lexicon(lexicon_raw):
     lexicon = defaultdict(list)
-    for line in lexicon_raw.decode('utf-8').split("\n"):
+    for word, analysis in lexicon_entries(lexicon_raw):
+        lexicon[word].append(analysis)
+    return lexicon
+
+
+def lexicon_entries(lexicon_raw, ud=None):
+    """
+    Convert the lines of a Freeling dictionary source into lexicon entries
+    as they are read
+    :param lexicon_raw: Bytes or string with the whole dictionary, or file
+                        object or iterable of lines (bytes or strings) with
+                        a `word lemma eagle` entry per line
+    :param ud: UD POS to assign. `None` to convert it from the EAGLE code
+    :return: Generator of tuples `(word, analysis)`
+    """
+    if isinstance(lexicon_raw, bytes):
+        lexicon_raw = lexicon_raw.decode("utf-8")
+    if isinstance(lexicon_raw, str):
+        lexicon_raw = lexicon_raw.split("\n")
+    for line in lexicon_raw:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if len(line.strip()) == 0:
+            continue
         word, lemma, eagle = line.split()
-        lexicon[word].append({
+        pos, tags = eagles2pos_tags(eagle)
+        yield word, {
             'lemma': lemma,
             'eagle': eagle,
-            'ud': eagle2pos(eagle),
-            'tags': eagle2tag(eagle).split("__")[1],
-        })
-    return lexicon
+            'ud': ud or pos,
+            'tags': tags,
+        }
 
 
 def get_assigned_lemma(rule, **opts):
@@ -217,33 +614,36 @@ def get_assigned_lemma(rule, **opts):
         "L": opts["lemma"],
         "F": opts["token_lower"],
     }
-    return "".join([ralf.get(opt, opt) for opt in rule.split("+")])
+    # Templates can also be given already split
+    template = rule.split("+") if isinstance(rule, str) else rule
+    return "".join([ralf.get(opt, opt) for opt in template])
 
 
 def get_morfo(string, lexicon, regex, assign_pos, assign_lemma,
-              **assign_lemma_opts):
+              category=None, **assign_lemma_opts):
     # Checks for string in the lexicon
     # Returns EAGLE, UD, tags, lemma
-    if string in lexicon:
+    # If the EAGLE category prefix `category` is given, only the analyses
+    # starting with it are checked against `regex` (if any)
+    if category is not None:
+        entry = lookup_category(lexicon, string, category)
+    elif string in lexicon:
         entry = lexicon[string]
-        for definition in entry:
-            if regex.match(definition["eagle"]):
-                assign_lemma_opts.update({
-                    "lemma": definition["lemma"]
-                })
-                lemma = get_assigned_lemma(assign_lemma, **assign_lemma_opts)
-                if assign_pos:
-                    return (
-                        assign_pos,
-                        eagle2pos(assign_pos),
-                        eagle2tag(assign_pos).split('__')[1],
-                        lemma
-                    )
-                else:
-                    return (
-                        definition["eagle"],
-                        definition["ud"],
-                        definition["tags"],
-                        lemma
-                    )
+    else:
+        entry = ()
+    for definition in entry:
+        if regex is None or regex.match(definition["eagle"]):
+            assign_lemma_opts.update({
+                "lemma": definition["lemma"]
+            })
+            lemma = get_assigned_lemma(assign_lemma, **assign_lemma_opts)
+            if assign_pos:
+                return (assign_pos, *eagles2pos_tags(assign_pos), lemma)
+            else:
+                return (
+                    definition["eagle"],
+                    definition["ud"],
+                    definition["tags"],
+                    lemma
+                )
     return None
@@ -301,19 +301,8 @@ snapshots['test_split_on_all 3'] = [
         0
     ],
     [
-        'hispano',
         'hispanoamericano',
-        'ADJ',
-        'Gender=Masc|Number=Sing',
-        True,
-        'prefix_hispano',
-        'prefix',
-        'americano',
-        1
-    ],
-    [
-        'americano',
-        'americano',
+        'hispanoamericano',
         'ADJ',
         'ADJ__Gender=Masc|Number=Sing',
         False,
@@ -743,11 +732,11 @@ snapshots['test_split_on_verbs 3'] = [
     [
         'hispanoamericano',
         'hispanoamericano',
-        True,
-        'prefix_hispano',
-        'prefix',
-        'americano',
-        1
+        False,
+        None,
+        None,
+        None,
+        0
     ],
     [
         'y',
@@ -964,12 +953,12 @@ snapshots['test_accent_exceptions 2'] = [
 snapshots['test_accent_exceptions 3'] = [
     [
         'mágicamente',
-        'mágicamente',
-        False,
-        None,
-        None,
-        None,
-        0
+        'mágico',
+        True,
+        'suffix_mente',
+        'suffix',
+        'mágica',
+        1
     ]
 ]
 
@@ -2,16 +2,75 @@
 # -*- coding: utf-8 -*-
 """Tests for `spacy_affixes` package."""
 import json
+import os
+import pickle
 from pathlib import Path
 
 import pytest
 import spacy
 from spacy_affixes import AffixesMatcher
+from spacy_affixes import utils
+from spacy_affixes.annotate import annotate
+from spacy_affixes.annotate import load_pipeline
+from spacy_affixes.bloom import BloomFilter
+from spacy_affixes.lexicon import BinaryLexicon
+from spacy_affixes.lexicon import FilteredLexicon
+from spacy_affixes.lexicon import FoldedLexicon
+from spacy_affixes.lexicon import LazyLexicon
+from spacy_affixes.lexicon import lexicon_eagles
+from spacy_affixes.lexicon import lookup_category
+from spacy_affixes.lexicon import share_lexicon
+from spacy_affixes.lexicon import write_binary_entries
+from spacy_affixes.lexicon import write_binary_lexicon
+from spacy_affixes.prune import profile_rules
+from spacy_affixes.prune import prune_rules
+from spacy_affixes.rules import AffixRule
+from spacy_affixes.rules import pos_category
+from spacy_affixes.trie import AffixesTrie
+from spacy_affixes.utils import build_affixes
+from spacy_affixes.utils import build_lexicon
 from spacy_affixes.utils import download
+from spacy_affixes.utils import dump_affixes
+from spacy_affixes.utils import load_affixes
 from spacy_affixes.utils import eagle2tag
+from spacy_affixes.utils import lexicon_entries
+from spacy_affixes.utils import strip_accents
+from spacy_affixes.utils import unicodedata_strip_accents
+from spacy_affixes.eagles import EAGLES_TABLE
+from spacy_affixes.eagles import eagles2pos_tags
 from spacy_affixes.eagles import eagles2ud
+from spacy_affixes.eagles import precompute_eagles
 
-download("es")
+FIXTURES_DIR = Path("tests/fixtures/freeling")
+LEXICON_CATEGORIES = ("adj", "adv", "int", "nom", "vaux", "verb", "tanc")
+
+
+def write_mirror(mirror_dir):
+    """
+    Lay out the Freeling fixtures as a Freeling repository mirror, with the
+    whole dictionary in the category detected from the EAGLES tags
+    """
+    sources_dir = mirror_dir / "4.1" / "data" / "es"
+    entries_dir = sources_dir / "dictionary" / "entries"
+    entries_dir.mkdir(parents=True)
+    (sources_dir / "afixos.dat").write_bytes(
+        (FIXTURES_DIR / "afixos.dat").read_bytes())
+    for category in LEXICON_CATEGORIES:
+        (entries_dir / f"MM.{category}").write_bytes(
+            (FIXTURES_DIR / "dicc.src").read_bytes() if category == "tanc"
+            else b"")
+    return str(mirror_dir)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def data_dir(tmp_path_factory):
+    """Data directory with the Freeling fixtures downloaded from a mirror"""
+    base_dir = tmp_path_factory.mktemp("spacy_affixes")
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setattr(utils, "DATA_DIR", str(base_dir / "data"))
+    download("es", base_url=write_mirror(base_dir / "mirror"))
+    yield utils.DATA_DIR
+    monkeypatch.undo()
 
 
 @pytest.fixture
@@ -53,6 +112,246 @@ def test_split_on_all(snapshot, nlp):
             ] for token in nlp(doc)])
 
 
+def test_pipe(nlp):
+    affixes_matcher = AffixesMatcher(nlp, split_on=["VERB"])
+    nlp.add_pipe(affixes_matcher, name="affixes", before="tagger")
+    texts = (
+        "Cuéntamelo bien y dilo claro, no me des un caramelo.",
+        "Hay que hacérselo todo.",
+    ) * 3
+    piped = [[
+        (token.text, token.lemma_, token._.affixes_rule) for token in doc
+    ] for doc in nlp.pipe(texts, batch_size=4)]
+    called = [[
+        (token.text, token.lemma_, token._.affixes_rule) for token in nlp(text)
+    ] for text in texts]
+    assert piped == called
+
+
+def test_resolutions_cache(nlp):
+    affixes_matcher = AffixesMatcher(nlp, split_on=["VERB"], cache_size=1)
+    nlp.add_pipe(affixes_matcher, name="affixes", before="tagger")
+    lemmas = [token.lemma_ for token in nlp("dímelo, dímelo.")]
+    assert lemmas[0] == lemmas[4] == "decir"
+    assert affixes_matcher.cache_misses == 1
+    nlp("dímelo, hacérselo, dímelo.")
+    assert affixes_matcher.cache_hits == 1
+    assert affixes_matcher.cache_misses == 2
+    assert len(affixes_matcher.cache) == 1
+    affixes_matcher.clear_cache()
+    assert not affixes_matcher.cache
+    assert affixes_matcher.cache_hits == affixes_matcher.cache_misses == 0
+
+
+def test_schedule_candidates(nlp):
+    rules = build_affixes(
+        "<Suffixes>\n"
+        "ilo\t*\t^N\t*\t0\t1\tL\t0\t-\n"
+        "lo\t*\t^V\t*\t0\t1\tL\t0\t$$+lo:$$+PP\n"
+        "</Suffixes>\n"
+        "<Prefixes>\n"
+        "</Prefixes>\n"
+    )
+    lexicon = {"di": [{"lemma": "decir", "eagle": "VMM02S0", "ud": "VERB",
+                       "tags": "Mood=Imp|Number=Sing|Person=2"}]}
+    affixes_matcher = AffixesMatcher(nlp, rules=rules, lexicon=lexicon)
+    doc = nlp.make_doc("dilo")
+    tokens = affixes_matcher.match(doc)
+    assert [rule_keys for _, rule_keys in tokens] == [
+        ("suffix_ilo", "suffix_lo")]
+    doc = affixes_matcher(doc)
+    assert doc[0]._.affixes_rule == "suffix_lo"
+    assert doc[0].lemma_ == "decir"
+    assert affixes_matcher.rule_attempts["suffix_ilo"] == 1
+    assert affixes_matcher.rule_successes["suffix_lo"] == 1
+
+
+def test_schedule_history(nlp):
+    rules = build_affixes(
+        "<Suffixes>\n"
+        "lo\t*\t^V\t*\t0\t1\tL\t0\t$$+lo:$$+PP\n"
+        "</Suffixes>\n"
+        "<Prefixes>\n"
+        "di\t*\t^P\t*\t0\t0\tF\t0\t-\n"
+        "</Prefixes>\n"
+    )
+    lexicon = {
+        "di": [{"lemma": "decir", "eagle": "VMM02S0", "ud": "VERB",
+                "tags": "Mood=Imp|Number=Sing|Person=2"}],
+        "haz": [{"lemma": "hacer", "eagle": "VMM02S0", "ud": "VERB",
+                 "tags": "Mood=Imp|Number=Sing|Person=2"}],
+        "lo": [{"lemma": "él", "eagle": "PP3MSA0", "ud": "PRON",
+                "tags": "Gender=Masc|Number=Sing"}],
+    }
+    fresh_matcher = AffixesMatcher(nlp, rules=rules, lexicon=lexicon)
+    assert fresh_matcher(nlp.make_doc("dilo"))[0]._.affixes_rule == (
+        "prefix_di")
+    # Only the suffix rule produces analyses while warming up
+    for freeze in (False, True):
+        warm_matcher = AffixesMatcher(nlp, rules=rules, lexicon=lexicon)
+        warm_matcher(nlp.make_doc("hazlo"))
+        assert warm_matcher.rule_successes["suffix_lo"] == 1
+        if freeze:
+            warm_matcher.freeze_schedule()
+        doc = warm_matcher(nlp.make_doc("dilo"))
+        assert doc[0]._.affixes_rule == (
+            "suffix_lo" if freeze else "prefix_di")
+
+
+def test_known_words_gate(nlp):
+    affixes_matcher = AffixesMatcher(nlp, split_on=["VERB"])
+    nlp.add_pipe(affixes_matcher, name="affixes", before="tagger")
+    assert "hispanoamericano" in affixes_matcher.lexicon
+    doc = nlp("Soy hispanoamericano.")
+    assert not doc[1]._.has_affixes
+    assert nlp("Dímelo.")[0]._.has_affixes
+
+
+def test_resolution_string_ids(nlp):
+    affixes_matcher = AffixesMatcher(nlp, split_on=["VERB"])
+    doc = nlp.make_doc("dímelo")
+    tokens = affixes_matcher.match(doc)
+    resolution, = affixes_matcher.resolve(tokens).values()
+    strings = nlp.vocab.strings
+    assert strings[resolution.lemma_id] == resolution.lemma == "decir"
+    assert strings[resolution.tags_id] == resolution.tags
+    assert strings[resolution.pos_id] == resolution.pos == "VERB"
+
+
+def test_lexicon_filter(nlp):
+    words = [f"palabra{index}" for index in range(1000)]
+    bloom_filter = BloomFilter.from_keys(words, error_rate=0.01)
+    assert all(word in bloom_filter for word in words)
+    misses = sum(f"otra{index}" in bloom_filter for index in range(1000))
+    assert misses < 50
+    copy = BloomFilter.from_bytes(bloom_filter.to_bytes())
+    assert copy.array == bloom_filter.array and copy.items == 1000
+    affixes_matcher = AffixesMatcher(nlp, split_on=["VERB"],
+                                     lexicon_filter=True)
+    assert isinstance(affixes_matcher.lexicon, FilteredLexicon)
+    assert "di" in affixes_matcher.lexicon
+    assert affixes_matcher.lexicon.lookup("palabra0", "V") == []
+    nlp.add_pipe(affixes_matcher, name="affixes", before="tagger")
+    assert nlp("Dímelo.")[0].lemma_ == "decir"
+
+
+def test_stats(nlp):
+    affixes_matcher = AffixesMatcher(nlp, split_on=["VERB"], instrument=True)
+    nlp.add_pipe(affixes_matcher, name="affixes", before="tagger")
+    nlp("dímelo, dímelo.")
+    stats = affixes_matcher.stats()
+    assert stats["docs"] == 1
+    assert stats["candidates"] >= 2
+    assert stats["lexicon_lookups"] >= 1
+    assert set(stats["timings"]) == {
+        "match", "resolve", "retokenize", "lemmas"}
+    assert stats["cache"]["misses"] == 1
+    rule_key = nlp("dímelo")[0]._.affixes_rule
+    assert stats["rules"][rule_key]["applied"] == 2
+    assert affixes_matcher.stats()["cache"]["hit_rate"] == 0.5
+    affixes_matcher.reset_stats()
+    stats = affixes_matcher.stats()
+    assert stats["docs"] == 0 and not stats["rules"]
+    assert stats["cache"]["size"] > 0
+
+
+def test_prune_rules(nlp, tmp_path):
+    rules = load_affixes()
+    texts = ("Dímelo.", "Hay que hacérselo todo.")
+    analyses = profile_rules(nlp, texts, rules)
+    assert set(analyses) == set(rules)
+    pruned = prune_rules(rules, analyses)
+    assert 0 < len(pruned) < len(rules)
+    assert all(analyses[rule_key] for rule_key in pruned)
+    rules_path = tmp_path / "affixes.json"
+    dump_affixes(pruned, rules_path)
+    affixes_matcher = AffixesMatcher(
+        nlp, rules=json.loads(rules_path.read_text()))
+    nlp.add_pipe(affixes_matcher, name="affixes", before="tagger")
+    assert nlp("Dímelo.")[0].lemma_ == "decir"
+
+
+def test_replace_lemmas_after_splits(nlp):
+    affixes_matcher = AffixesMatcher(nlp, split_on="*")
+    doc = affixes_matcher(nlp.make_doc("Hay que hacérselo y dímelo ya."))
+    assert [(token.text, token.lemma_)
+            for token in doc if token._.has_affixes] == [
+        ("hacér", "hacer"), ("dí", "decir")]
+
+
+def test_annotate(tmp_path):
+    input_path = tmp_path / "corpus.jsonl"
+    output_path = tmp_path / "corpus.out.jsonl"
+    texts = ["Dímelo.", "Hay que hacérselo todo.", "Soy hispanoamericano."]
+    input_path.write_text("".join(
+        json.dumps({"id": index, "text": text}) + "\n"
+        for index, text in enumerate(texts)
+    ))
+    annotate(str(input_path), str(output_path), batch_size=2)
+    records = [json.loads(line)
+               for line in output_path.read_text().splitlines()]
+    assert [record["id"] for record in records] == [0, 1, 2]
+    assert [record["text"] for record in records] == texts
+    assert records[0]["tokens"][0]["lemma"] == "decir"
+    assert records[0]["tokens"][0]["has_affixes"]
+
+
+def test_load_pipeline():
+    nlp = load_pipeline("es", ["VERB"])
+    assert load_pipeline("es", ("VERB", )) is nlp
+    other_nlp = load_pipeline("es", "*")
+    assert other_nlp is not nlp
+    assert other_nlp.get_pipe("affixes").split_on == "*"
+
+
+def test_download_from_mirror(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(utils, "DATA_DIR", str(tmp_path / "data"))
+    base_url = write_mirror(tmp_path / "mirror")
+    download("es", base_url=base_url)
+    assert utils.load_lexicon("es", "4.1")["di"][0]["lemma"] == "decir"
+    capsys.readouterr()
+    download("es", base_url=base_url)
+    assert capsys.readouterr().out.endswith("up to date\n")
+    with pytest.raises(ValueError):
+        download("es", base_url=base_url, force=True,
+                 checksums={"MM.adj": "0" * 64})
+
+
+def test_load_bundle(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "DATA_DIR", str(tmp_path))
+    affixes_raw = Path("tests/fixtures/freeling/afixos.dat").read_text()
+    rules = build_affixes(affixes_raw)
+    utils.write_affixes("es", "4.1", rules)
+    bundle = utils.load_bundle("es", "4.1")
+    bundles = list(tmp_path.glob("bundle-es-4.1-*.pickle"))
+    assert len(bundles) == 1
+    cached = utils.load_bundle("es", "4.1")
+    assert cached is not bundle
+    assert {key: [dict(rule) for rule in rule_list]
+            for key, rule_list in cached["rules"].items()} == {
+        key: [dict(rule) for rule in rule_list]
+        for key, rule_list in rules.items()}
+    assert cached["trie"]("dímelo") == bundle["trie"]("dímelo")
+    utils.write_affixes("es", "4.1", dict(list(rules.items())[:1]))
+    assert len(utils.load_bundle("es", "4.1")["rules"]) == 1
+    assert list(tmp_path.glob("bundle-es-4.1-*.pickle")) != bundles
+
+
+def test_load_bundle_read_only(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "DATA_DIR", str(tmp_path))
+    affixes_raw = Path("tests/fixtures/freeling/afixos.dat").read_text()
+    rules = build_affixes(affixes_raw)
+    utils.write_affixes("es", "4.1", rules)
+    utils.load_bundle("es", "4.1")
+    utils.write_affixes("es", "4.1", dict(list(rules.items())[:1]))
+
+    def remove(path):
+        raise PermissionError(path)
+
+    monkeypatch.setattr(utils.os, "remove", remove)
+    assert len(utils.load_bundle("es", "4.1")["rules"]) == 1
+
+
 def test_eagle2tag():
     output = 'NOUN__Gender=Masc|Number=Sing'
     assert eagle2tag('NCMS000') == output
@@ -63,6 +362,15 @@ def test_eagle2tag_not_in_dict():
     assert eagle2tag('WHATEVER') == output
 
 
+def test_strip_accents():
+    strings = ("dímelo", "Ñandú", "pingüino", "ÀÉÎÕÜ", "ǅ", "Ωμέγα",
+               "x\u0303\u0301")
+    for string in strings:
+        assert strip_accents(string) == unicodedata_strip_accents(string)
+    assert strip_accents("acción") == "accion"
+    assert strip_accents("año") == "an\u0303o"
+
+
 def test_get_morfo_rules(snapshot, nlp):
     affixes_matcher = AffixesMatcher(nlp)
     nlp.add_pipe(affixes_matcher, name="affixes", before="tagger")
@@ -128,6 +436,44 @@ def test_accent_exceptions(snapshot, nlp):
         ] for token in nlp(doc)])
 
 
+def test_folded_lexicon():
+    lexicon = {word: [] for word in ("esta", "está", "ésta", "mágica")}
+    folded_lexicon = FoldedLexicon(lexicon, strip_accents)
+    assert folded_lexicon.unfold("magica") == ("mágica", )
+    assert folded_lexicon.unfold("esta") == ("esta", "está", "ésta")
+    assert folded_lexicon.unfold("esta", "ésta") == ("esta", "ésta", "está")
+    assert folded_lexicon.unfold("mente") == ()
+    folded_lexicon = utils.load_lexicon(folded=True)
+    assert folded_lexicon.unfold("automatica") == ("automática", )
+
+
+def test_lazy_lexicon_lookup(nlp, monkeypatch):
+    calls = []
+    lookup = BinaryLexicon.lookup
+
+    def counted_lookup(self, word, category):
+        calls.append(word)
+        return lookup(self, word, category)
+
+    monkeypatch.setattr(BinaryLexicon, "lookup", counted_lookup)
+    affixes_matcher = AffixesMatcher(nlp)
+    assert isinstance(affixes_matcher.lexicon, LazyLexicon)
+    nlp.add_pipe(affixes_matcher, name="affixes", before="tagger")
+    assert nlp("dímelo")[0].lemma_ == "decir"
+    assert calls
+
+
+def test_fold_accents(nlp):
+    assert AffixesMatcher(nlp).folded_lexicon is None
+    affixes_matcher = AffixesMatcher(nlp, fold_accents=True)
+    assert affixes_matcher.folded_lexicon.index is None
+    nlp.add_pipe(affixes_matcher, name="affixes", before="tagger")
+    assert nlp("mágicamente")[0].lemma_ == "mágico"
+    assert affixes_matcher.folded_lexicon.index is not None
+    shared_matcher = AffixesMatcher(nlp, fold_accents=True, shared=True)
+    assert shared_matcher.folded_lexicon.index is not None
+
+
 def test_eagles2ud_dict(test_eagles):
     for idx, eagle in enumerate(test_eagles):
         res = eagles2ud(eagle).split("__")
@@ -136,6 +482,25 @@ def test_eagles2ud_dict(test_eagles):
         assert output == res_test
 
 
+def test_eagles2pos_tags(test_eagles):
+    table = precompute_eagles(test_eagles)
+    for eagle in test_eagles:
+        pos, tags = eagles2pos_tags(eagle)
+        assert f"{pos}__{tags}" == eagles2ud(eagle)
+        assert table[eagle] == (pos, tags)
+    assert EAGLES_TABLE is table
+
+
+def test_lexicon_eagles(nlp):
+    eagles = lexicon_eagles(utils.load_lexicon())
+    assert eagles and eagles <= set(utils.load_bundle()["eagles"])
+    assert eagles <= set(EAGLES_TABLE)
+    lexicon = {"cantaríais": [{"lemma": "cantar", "eagle": "VMIC2P0",
+                               "ud": "VERB", "tags": ""}]}
+    AffixesMatcher(nlp, lexicon=lexicon)
+    assert EAGLES_TABLE["VMIC2P0"] == eagles2pos_tags.__wrapped__("VMIC2P0")
+
+
 def test_spacy_affixes_no_lemma_lookup():
     nlp = spacy.load('es')  # noqa
     nlp.vocab.lookups.remove_table("lemma_lookup")
@@ -152,3 +517,176 @@ def test_spacy_affixes_no_vocab_lookups():
     nlp.add_pipe(affixes_matcher, name="affixes", before="tagger")
     nlp("Ese hombre está demente")
     assert True
+
+
+def test_affixes_trie():
+    rules = build_affixes(
+        "<Suffixes>\n"
+        "lo\t*\t^V\t*\t0\t1\tL\t0\t$$+lo:$$+PP\n"
+        "melo\t*\t^V\t*\t0\t1\tL\t0\t$$+me+lo:$$+PP+PP\n"
+        "i[tc]o\to\t^N\t*\t1\t0\tL\t0\t-\n"
+        "</Suffixes>\n"
+        "<Prefixes>\n"
+        "anti\t*\t^N\t*\t1\t0\tF\t0\t-\n"
+        "</Prefixes>\n"
+    )
+    trie = AffixesTrie(rules)
+    assert trie("Dímelo") == ["suffix_melo", "suffix_lo"]
+    assert trie("ANTIFAZ") == ["prefix_anti"]
+    assert trie("pajarico") == ["suffix_i[tc]o"]
+    assert trie("antimelo") == ["suffix_melo", "prefix_anti", "suffix_lo"]
+    assert trie("l") == []
+    assert trie("casa") == []
+    assert trie.alphabetic and trie.regex_min_length == 3
+
+
+def test_affixes_prefilter(nlp):
+    rules = build_affixes(
+        "<Suffixes>\n"
+        "lo\t*\t^V\t*\t0\t1\tL\t0\t$$+lo:$$+PP\n"
+        "</Suffixes>\n"
+        "<Prefixes>\n"
+        "</Prefixes>\n"
+    )
+    trie = AffixesTrie(rules)
+    assert trie.alphabetic
+    assert trie.min_length == 3
+    assert trie("lo") == []
+    assert trie("dilo") == ["suffix_lo"]
+    affixes_matcher = AffixesMatcher(nlp, rules=rules)
+    doc = nlp.make_doc("dilo 2lo http://a.lo lo Dilo")
+    assert [token.i for token, _ in affixes_matcher.match(doc)] == [0, 4]
+    assert not affixes_matcher.match(nlp.make_doc(""))
+
+
+def test_affixes_prefilter_regex_rules(nlp):
+    rules = dict(build_affixes(
+        "<Suffixes>\n"
+        "lo\t*\t^V\t*\t0\t1\tL\t0\t$$+lo:$$+PP\n"
+        "</Suffixes>\n"
+        "<Prefixes>\n"
+        "</Prefixes>\n"
+    ))
+    rules["suffix_lo_digit"] = [{
+        "pattern": "lo[0-9]$",
+        "kind": "suffix",
+        "pos_re": "^V",
+        "assign_pos": "",
+        "strip_accent": False,
+        "assign_lemma": "L",
+        "always_apply": False,
+        "affix_add": [""],
+        "affix_text": ["lo"],
+    }]
+    trie = AffixesTrie(rules)
+    assert trie.alphabetic
+    assert (trie.min_length, trie.regex_min_length) == (3, 4)
+    affixes_matcher = AffixesMatcher(nlp, rules=rules)
+    doc = nlp.make_doc("dilo 2lo dilo3 lo3 lo")
+    assert [(token.i, rule_keys)
+            for token, rule_keys in affixes_matcher.match(doc)] == [
+        (0, ("suffix_lo", )), (2, ("suffix_lo_digit", ))]
+
+
+def test_affix_rule():
+    rule = {
+        "pattern": "ísimo$",
+        "kind": "suffix",
+        "pos_re": "^A",
+        "assign_pos": "",
+        "strip_accent": False,
+        "assign_lemma": "R+A",
+        "always_apply": False,
+        "affix_add": ["o", "ado"],
+        "affix_text": ["ísimo"],
+    }
+    affix_rule = AffixRule.compile(rule)
+    assert dict(affix_rule) == rule
+    assert affix_rule["pos_re"] == affix_rule.pos_re == "^A"
+    assert affix_rule.regex.sub("", "buenísimo") == "buen"
+    assert affix_rule.pos_regex.match("aq0ms00")
+    assert affix_rule.affix_length == 5
+    assert affix_rule.lemma_template == ("R", "A")
+    assert AffixRule.compile(affix_rule) is affix_rule
+    assert dict(pickle.loads(pickle.dumps(affix_rule))) == rule
+
+
+def test_pos_category():
+    assert pos_category("^V") == ("V", True)
+    assert pos_category("^vm.*") == ("VM", True)
+    assert pos_category("^A.*F") == ("A", False)
+    assert pos_category("^NCM?") == ("NC", False)
+    assert pos_category("^[NA]") == (None, False)
+    assert pos_category("^V|^N") == (None, False)
+
+
+def test_binary_lexicon(tmp_path):
+    lexicon = {
+        "dí": [{"lemma": "decir", "eagle": "VMM02S0", "ud": "VERB",
+                "tags": "Mood=Imp|Number=Sing|Person=2|VerbForm=Fin"},
+               {"lemma": "dar", "eagle": "VMIS1S0", "ud": "VERB",
+                "tags": "Mood=Ind|Number=Sing|Person=1|Tense=Past"}],
+        "casa": [{"lemma": "casa", "eagle": "NCFS000", "ud": "NOUN",
+                  "tags": "Gender=Fem|Number=Sing"}],
+        "bien": [{"lemma": "bien", "eagle": "RG", "ud": "ADV", "tags": ""}],
+    }
+    path = tmp_path / "lexicon.bin"
+    write_binary_lexicon(path, lexicon)
+    binary_lexicon = BinaryLexicon(path)
+    assert dict(binary_lexicon) == lexicon
+    assert "casa" in binary_lexicon
+    assert "casas" not in binary_lexicon
+    assert binary_lexicon.get("casas") is None
+    assert list(binary_lexicon) == ["bien", "casa", "dí"]
+    for lexicon_ in (lexicon, binary_lexicon):
+        assert lookup_category(lexicon_, "dí", "VMI") == lexicon["dí"][1:]
+        assert lookup_category(lexicon_, "dí", "N") == []
+        assert lookup_category(lexicon_, "casas", "N") == []
+
+
+def test_streamed_binary_lexicon(tmp_path):
+    dictionary = Path("tests/fixtures/freeling/dicc.src")
+    lexicon = build_lexicon(dictionary.read_bytes())
+    path = tmp_path / "lexicon.bin"
+    with dictionary.open("rb") as lexicon_raw:
+        # Entries are sorted in runs of 16, the analyses of a word keep
+        # their order across runs
+        write_binary_entries(path, lexicon_entries(lexicon_raw), 16)
+    assert dict(BinaryLexicon(path)) == lexicon
+
+
+def test_lazy_lexicon():
+    loads = []
+
+    def loader():
+        loads.append(True)
+        return {"casa": [{"lemma": "casa", "eagle": "NCFS000",
+                          "ud": "NOUN", "tags": "Gender=Fem|Number=Sing"}]}
+
+    lexicon = LazyLexicon(loader)
+    assert not loads
+    assert "casa" in lexicon
+    assert lexicon["casa"][0]["lemma"] == "casa"
+    assert "casas" not in lexicon
+    assert lexicon.lookup("casa", "NC")[0]["lemma"] == "casa"
+    assert len(loads) == 1
+
+
+def test_shared_lexicon(nlp, tmp_path):
+    affixes_matcher = AffixesMatcher(nlp, shared=True)
+    other_matcher = AffixesMatcher(nlp, shared=True)
+    assert affixes_matcher.lexicon is other_matcher.lexicon
+    assert affixes_matcher.rules["suffix_melo"][0] is (
+        other_matcher.rules["suffix_melo"][0])
+    lexicon = affixes_matcher.lexicon
+    assert pickle.loads(pickle.dumps(lexicon)) is lexicon
+    lexicon_dict = {"casa": [{"lemma": "casa", "eagle": "NCFS000",
+                              "ud": "NOUN", "tags": "Gender=Fem|Number=Sing"}]}
+    path = tmp_path / "shared.bin"
+    shared_lexicon = share_lexicon(lexicon_dict, path=str(path))
+    assert dict(shared_lexicon) == lexicon_dict
+    assert share_lexicon(shared_lexicon) is shared_lexicon
+    temporary_lexicon = share_lexicon(lexicon_dict)
+    assert share_lexicon(dict(lexicon_dict)) is temporary_lexicon
+    assert os.path.isfile(temporary_lexicon.path)
+    assert dict(temporary_lexicon) == lexicon_dict